@@ -2,9 +2,9 @@ import setuptools
 
 with open("README.txt", "r") as fh:
     long_description = fh.read()
-print('Number of pacakages: {0}'.format(len(setuptools.find_packages())))
-for p in setuptools.find_packages():
-    print('Pacckage: ' + p)
+
+# Only walk the source tree once
+packages = setuptools.find_packages()
 
 setuptools.setup(
     name='spongecake',
@@ -13,7 +13,25 @@ setuptools.setup(
     description="Equity Data Analyser",
     long_description=long_description,
     long_description_content_type="text/markdown",
-    packages=setuptools.find_packages(),
+    packages=packages,
+    # dataclass(slots=True) needs 3.10
+    python_requires='>=3.10',
+    install_requires=[
+        'lxml',
+        'numpy',
+        'pandas',
+        'requests',
+        'yfinance',
+        # zoneinfo needs the IANA time zone database, which Windows doesn't ship
+        'tzdata; platform_system=="Windows"',
+    ],
+    extras_require={
+        'selectolax': ['selectolax'],
+        'http_cache': ['requests-cache'],
+        'brotli': ['brotli'],
+        'numba': ['numba'],
+        'parquet': ['pyarrow'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
@@ -1,47 +1,367 @@
+import asyncio
+import codecs
+import functools
+import io
 import logging as log
-import requests as rq
-import pandas as pd
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from lxml import html as lh
+
+# pandas and requests are slow to import, so they're imported inside the functions that need them
+
+__all__ = [
+    'FinancialWebsiteInterface',
+    'extract_tables_from_raw_html',
+    'enable_http_cache',
+    'download_web_page',
+    'download_web_pages',
+    'download_tables_from_web_pages',
+    'download_web_pages_async',
+    'get_dataframes_from_html_tables',
+    'get_dataframes_from_html',
+    'iter_dataframes_from_html',
+    'get_dataframes_from_url',
+    'clean_numeric_column',
+]
+
+try:
+    # selectolax (Lexbor) is optional, but finds tables much faster than lxml when it is installed
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Cheap check for whether a page has any tables at all, before any full parse
+_TABLE_TAG_RE = re.compile(rb'<table\b', re.IGNORECASE)
+_TABLE_TAG_STR_RE = re.compile(r'<table\b', re.IGNORECASE)
+
+# The charset a response declares in its Content-Type header, e.g. 'text/html; charset=utf-8'
+_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+# The charset a page declares itself, in a <meta> tag or an xml declaration
+_DOCUMENT_CHARSET_RE = re.compile(rb'<(?:meta|\?xml)[^>]*?(?:charset|encoding)\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+# For clean_numeric_column(): currency symbols and thousands separators to strip, and accountants' (bracketed) negatives
+_CURRENCY_AND_SEPARATORS_RE = re.compile(r'[\$,]')
+_BRACKETED_NEGATIVE_RE = re.compile(r'^\((.*)\)$')
+
+# (connect, read) timeouts in seconds for every download
+HTTP_TIMEOUT = (3.05, 30)
+
+# Some sites throttle the default python-requests User-Agent, so identify as a browser instead
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+# url -> (ETag, Last-Modified, content) for conditional GETs, bounded to the most recently used pages
+CONDITIONAL_GET_CACHE_MAXSIZE = 128
+_CONDITIONAL_GET_CACHE = OrderedDict()
+_CONDITIONAL_GET_CACHE_LOCK = threading.Lock()
+
+
+def _configure_session(session):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Keep connections to each host alive and pooled between downloads, and retry transient failures with a short backoff
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.3)))
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+# Created on first use by _get_session(), or replaced by enable_http_cache()
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _get_session():
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                import requests as rq
+                _SESSION = _configure_session(rq.Session())
+    return _SESSION
+
+
+def _has_tables(data):
+    if not data:
+        return False
+    table_tag_re = _TABLE_TAG_RE if isinstance(data, bytes) else _TABLE_TAG_STR_RE
+    return table_tag_re.search(data) is not None
+
+
+def _as_html_bytes(data):
+    # lxml won't parse a str carrying an <?xml encoding?> declaration, so hand it utf-8 bytes instead
+    if isinstance(data, str):
+        return data.encode('utf-8'), 'utf-8'
+    return data, None
+
+
+def extract_tables_from_raw_html(data):
+    if not _has_tables(data):
+        log.warning('No tables in html data, returning no tables')
+        return []
+
+    # Lexbor ignores <meta charset> in bytes, so it's only used for str
+    if LexborHTMLParser is not None and isinstance(data, str):
+        tables = [node.html for node in LexborHTMLParser(data).css('table')]
+    else:
+        data, encoding = _as_html_bytes(data)
+        document = lh.fromstring(data, parser=lh.HTMLParser(encoding=encoding))
+        tables = [lh.tostring(table, encoding='unicode', with_tail=False) for table in document.iter('table')]
+    log.info('Returning [{0}] tables found in html data'.format(len(tables)))
+    return tables
+
+
+def enable_http_cache(cache_name='spongecake_http_cache', expire_after=timedelta(hours=24)):
+    # Keep responses in an on-disk sqlite cache. Prices come from the summary page, so are as old as the cache
+    global _SESSION
+    try:
+        # requests-cache is optional, and only needed here
+        import requests_cache
+    except ImportError:
+        log.error('requests-cache is not installed, so the http cache cannot be enabled.')
+        return False
+
+    log.info('Enabling http cache [{0}] with responses expiring after {1}'.format(cache_name, expire_after))
+    with _SESSION_LOCK:
+        _SESSION = _configure_session(requests_cache.CachedSession(cache_name, backend='sqlite', expire_after=expire_after,
+                                                                   allowable_codes=(200,), stale_if_error=True))
+    return True
+
+
+def _known_charset(charset, url):
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        log.warning('Unknown charset [{0}] declared by {1}, ignoring it.'.format(charset, url))
+        return None
+    return charset
+
+
+def _declared_charset(http_result):
+    # Only a charset the server actually declared; requests' own .encoding guesses ISO-8859-1 for any text/* without one
+    charset_match = _CHARSET_RE.search(http_result.headers.get('Content-Type', ''))
+    return _known_charset(charset_match.group(1), http_result.url) if charset_match else None
+
+
+def _decode_page(http_result):
+    # The server's charset, then one declared in the first 1024 bytes, then utf-8
+    content = http_result.content
+    charset = _declared_charset(http_result)
+    if charset is None:
+        charset_match = _DOCUMENT_CHARSET_RE.search(content, 0, 1024)
+        if charset_match is not None:
+            charset = _known_charset(charset_match.group(1).decode('ascii'), http_result.url)
+    return content.decode(charset or 'utf-8', errors='replace')
+
+
+def download_web_page(url):
+    # Returns the page as text, or '' if it couldn't be downloaded
+
+    # If we've seen this page before and the server gave us validators for it, ask for it only if it has changed
+    request_headers = {}
+    with _CONDITIONAL_GET_CACHE_LOCK:
+        cached_page = _CONDITIONAL_GET_CACHE.get(url)
+        if cached_page is not None:
+            _CONDITIONAL_GET_CACHE.move_to_end(url)
+    if cached_page is not None:
+        etag, last_modified, _ = cached_page
+        if etag:
+            request_headers['If-None-Match'] = etag
+        if last_modified:
+            request_headers['If-Modified-Since'] = last_modified
+
+    http_result = _request_web_page(url, headers=request_headers)
+    if http_result is None:
+        return ''
+
+    if http_result.status_code == 304 and cached_page is not None:
+        log.info('{0} has not changed since it was last downloaded, using previous copy.'.format(url))
+        return cached_page[2]
+
+    page = _decode_page(http_result)
+    etag = http_result.headers.get('ETag')
+    last_modified = http_result.headers.get('Last-Modified')
+    if etag or last_modified:
+        with _CONDITIONAL_GET_CACHE_LOCK:
+            _CONDITIONAL_GET_CACHE[url] = (etag, last_modified, page)
+            _CONDITIONAL_GET_CACHE.move_to_end(url)
+            while len(_CONDITIONAL_GET_CACHE) > CONDITIONAL_GET_CACHE_MAXSIZE:
+                _CONDITIONAL_GET_CACHE.popitem(last=False)
+
+    return page
+
+
+def _request_web_page(url, stream=False, headers=None):
+    # requests negotiates gzip/deflate, and Brotli when the brotli package is installed
+    log.info('Attempting to download from following url: {0}'.format(url))
+    http_result = _get_session().get(url, stream=stream, headers=headers, timeout=HTTP_TIMEOUT)
+    if http_result.status_code not in (200, 304):
+        log.error('Received HTTP response code {0} when trying to call {1}. Returning nothing.'.format(http_result.status_code, url))
+        log.error(http_result.text)
+        http_result.close()
+        return None
+
+    if http_result.url != url:
+        log.warning('Unexpectedly re-directed when trying to call {0}. Sent to {1} instead.'.format(url, http_result.url))
+
+    return http_result
+
+
+def download_web_pages(urls, max_workers=16):
+    # Downloads are I/O bound, so fetch the pages concurrently over the shared session rather than one after another
+    return _map_over_urls(download_web_page, urls, max_workers)
+
+
+def download_tables_from_web_pages(urls, max_workers=16):
+    # As download_web_pages(), but the tables are pulled out of each page on the worker threads as well
+    def download_and_extract(url):
+        return extract_tables_from_raw_html(download_web_page(url))
+    return _map_over_urls(download_and_extract, urls, max_workers)
+
+
+async def download_web_pages_async(urls, max_workers=16):
+    # For callers running an event loop: the blocking downloads run on a thread pool
+    urls = list(dict.fromkeys(urls))
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = await asyncio.gather(*[loop.run_in_executor(executor, download_web_page, url) for url in urls])
+    return dict(zip(urls, pages))
+
+
+def _map_over_urls(func, urls, max_workers):
+    urls = list(dict.fromkeys(urls))
+    log.info('Downloading [{0}] urls using up to [{1}] threads'.format(len(urls), max_workers))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(urls, executor.map(func, urls)))
+
+
+def get_dataframes_from_html_tables(html_tables, headers=0, flavor='lxml'):
+    import pandas as pd
+
+    # Build DataFrame list from tables
+    income_dataframes = []
+    for html_table in html_tables:
+        income_dataframe = pd.read_html(io.StringIO(html_table), flavor=flavor, header=headers)
+        if len(income_dataframe) > 0:
+            # The read_html() function returns a list, but we know only one table will be returned for each item in the html_tables list,
+            # so we just take the head of the returned list
+            income_dataframes.append(income_dataframe[0])
+        else:
+            log.error('No tables were found in current iteration')
+    return income_dataframes
+
+
+def get_dataframes_from_html(data, headers=0, flavor='lxml'):
+    # Let read_html parse every table in one lxml pass. bs4 is only tried if lxml can't cope
+    if not _has_tables(data):
+        log.warning('No tables in html data, returning no dataframes')
+        return []
+
+    import pandas as pd
+    from lxml import etree
+
+    html_bytes, encoding = _as_html_bytes(data)
+
+    def read_html(flavor):
+        return pd.read_html(io.BytesIO(html_bytes), flavor=flavor, header=headers, encoding=encoding)
+
+    try:
+        try:
+            dataframes = read_html(flavor)
+        except etree.LxmlError as e:
+            if flavor != 'lxml':
+                raise
+            log.warning('lxml could not parse html data, trying bs4 instead: {0}'.format(e))
+            dataframes = read_html('bs4')
+    except ValueError:
+        log.error('No tables were found in html data')
+        return []
+    except ImportError as e:
+        log.error('Unable to parse html data: {0}'.format(e))
+        return []
+
+    log.info('Returning [{0}] dataframes built from html data'.format(len(dataframes)))
+    return dataframes
+
+
+def iter_dataframes_from_html(source, headers=0):
+    # Streams very large pages, yielding each top-level table as it's parsed and then discarding it
+    import pandas as pd
+    from lxml import etree
+
+    encoding = None
+    if isinstance(source, (bytes, str)):
+        if not _has_tables(source):
+            log.warning('No tables in html data, returning no dataframes')
+            return
+        source, encoding = _as_html_bytes(source)
+        source = io.BytesIO(source)
+
+    depth = 0
+    for event, table in etree.iterparse(source, events=('start', 'end'), tag='table', html=True, encoding=encoding):
+        if event == 'start':
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth > 0:
+            continue
+
+        try:
+            yield pd.read_html(io.BytesIO(etree.tostring(table, with_tail=False)), flavor='lxml', header=headers)[0]
+        except ValueError:
+            log.error('Unable to build a dataframe from a table in html data')
+
+        # Drop the table and any earlier siblings that are already finished with
+        table.clear(keep_tail=False)
+        while table.getprevious() is not None:
+            del table.getparent()[0]
+
+
+def clean_numeric_column(series):
+    # Scraped figures such as '$1,234.56' or '(2,345)' to floats, NaN for anything that isn't a number
+    import pandas as pd
+
+    if series.dtype != object:
+        return pd.to_numeric(series, errors='coerce')
+
+    cleaned = series.astype(str).str.replace(_CURRENCY_AND_SEPARATORS_RE, '', regex=True).str.replace(_BRACKETED_NEGATIVE_RE, r'-\1', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+@functools.lru_cache(maxsize=256)
+def get_dataframes_from_url(url, headers=0):
+    # Memoised per (url, headers). Failures raise, so they aren't. Copy a DataFrame before changing it
+    import pandas as pd
+
+    http_result = _request_web_page(url, stream=True)
+    if http_result is None:
+        raise ValueError('Could not download {0}'.format(url))
+
+    # Stream the body into lxml with the server's charset, as it would otherwise assume latin-1
+    with http_result:
+        http_result.raw.decode_content = True
+        try:
+            return tuple(pd.read_html(http_result.raw, flavor='lxml', header=headers, encoding=_declared_charset(http_result)))
+        except ValueError:
+            log.error('No tables were found at {0}'.format(url))
+            raise
 
 
 class FinancialWebsiteInterface:
+    # Static methods for existing callers and subclasses
 
-    @staticmethod
-    def extract_tables_from_raw_html(data):
-        tables = []
-        # Get first table tag position
-        table_tag_start_pos = data.find('<table')
-
-        while table_tag_start_pos != -1:
-            table_tag_end_pos = data.find('</table>', table_tag_start_pos)
-            tables.append(data[table_tag_start_pos:table_tag_end_pos + len('</table>')])
-            table_tag_start_pos = table_tag_start_pos = data.find('<table', table_tag_end_pos+len('</table>'))
-        log.info('Returning [{0}] tables found in html data'.format(len(tables)))
-        return tables
-
-    @staticmethod
-    def download_web_page(url):
-        log.info('Attempting to download from following url: {0}'.format(url))
-        http_result = rq.get(url)
-        if http_result.status_code != 200:
-            log.error('Received HTTP response code {0} when trying to call {1}. Returning nothing.')
-            log.error(http_result.text)
-            return ''
-
-        if http_result.url != url:
-            log.warning('Unexpectedly re-directed when trying to call {0}. Sent to {1} instead.'.format(url, http_result.url))
-
-        return http_result.text
-
-    @staticmethod
-    def get_dataframes_from_html_tables(html_tables, headers=0):
-        # Build DataFrame list from tables
-        income_dataframes = []
-        for html_table in html_tables:
-            income_dataframe = pd.read_html(html_table, header=headers)
-            if len(income_dataframe) > 0:
-                # The read_html() function returns a list, but we know only one table will be returned for each item in the html_tables list,
-                # so we just take the head of the returned list
-                income_dataframes.append(income_dataframe[0])
-            else:
-                log.error('No tables were found in current iteration')
-        return income_dataframes
+    extract_tables_from_raw_html = staticmethod(extract_tables_from_raw_html)
+    enable_http_cache = staticmethod(enable_http_cache)
+    download_web_page = staticmethod(download_web_page)
+    download_web_pages = staticmethod(download_web_pages)
+    download_tables_from_web_pages = staticmethod(download_tables_from_web_pages)
+    download_web_pages_async = staticmethod(download_web_pages_async)
+    get_dataframes_from_html_tables = staticmethod(get_dataframes_from_html_tables)
+    get_dataframes_from_html = staticmethod(get_dataframes_from_html)
+    iter_dataframes_from_html = staticmethod(iter_dataframes_from_html)
+    get_dataframes_from_url = staticmethod(get_dataframes_from_url)
+    clean_numeric_column = staticmethod(clean_numeric_column)
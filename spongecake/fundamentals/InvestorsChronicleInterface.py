@@ -1,59 +1,382 @@
+import asyncio
+import functools
+import gzip
 import logging as log
+import os
+import pickle
+import re
+import sys
+import threading
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from datetime import datetime, time, timedelta
+from time import monotonic
+from zoneinfo import ZoneInfo
 from spongecake.fundamentals.FinancialWebsiteInterface import FinancialWebsiteInterface
 
+# Figures like '1,234' or '(56)' (negative) become something float() can read
+_FIGURE_REPLACEMENTS = (('$', ''), (',', ''), (')', ''), ('(', '-'))
+
+# A cached sheet, with its latest column kept as a dict of row label -> value for the ratio getters
+Sheet = namedtuple('Sheet', 'df latest_col latest')
+
+
+def _make_sheet(df, latest_col):
+    # Row labels are interned, as the IC_*_DATA.ROW_* constants are, so looking one up finds the key by identity
+    labels = [sys.intern(label) if isinstance(label, str) else label for label in df.index]
+    return Sheet(df, latest_col, dict(zip(labels, df[latest_col].tolist())))
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    # The figures the price-based ratios need for one tidm. Sheet figures are in millions, the price in GBX
+    price: float
+    shares_outstanding: float
+    eps_ttm: float
+    income_before_tax: float
+    total_assets: float
+    total_liabilities: float
+    current_assets: float
+    current_liabilities: float
+    total_debt: float
+
+    def eps(self):
+        return self.income_before_tax * 1000000 / self.shares_outstanding
+
+    def price_to_earnings_ratio(self):
+        return (self.price / 100) / self.eps()
+
+    def earnings_yield_pct(self):
+        return self.eps() / (self.price / 100)
+
+    def earnings_yield_pct_ttm(self):
+        if self.eps_ttm == 0:
+            return 0
+        return self.eps_ttm / (self.price / 100)
+
+    def current_ratio(self):
+        return self.current_assets / self.current_liabilities
+
+    def nav(self):
+        return self.total_assets - self.total_liabilities
+
+    def nav_per_share(self):
+        return self.nav() * 1000000 / float(self.shares_outstanding)
+
+    def nav_per_share_as_pct_of_price(self):
+        return self.nav_per_share() / (self.price / 100)
+
+    def market_cap(self):
+        return (self.price / 100) * self.shares_outstanding
+
+
+def _clean_figures(df):
+    # Cleans every cell in one vectorised pass over a NumPy string array, then converts them all to floats
+    values = df.to_numpy(dtype=str)
+    for old, new in _FIGURE_REPLACEMENTS:
+        values = np.char.replace(values, old, new)
+    values[values == ''] = 'nan'
+
+    try:
+        return pd.DataFrame(values.astype(np.float64), index=df.index, columns=df.columns)
+    except ValueError:
+        # Something isn't a figure (e.g. '--'), so let pd.to_numeric turn those cells into NaN
+        floats = pd.to_numeric(values.ravel(), errors='coerce').astype(np.float64).reshape(values.shape)
+        return pd.DataFrame(floats, index=df.index, columns=df.columns)
+
+
+def _is_fresh(entry):
+    # Monotonic, so clock changes can't make entries look younger or older than they are
+    inserted_at, ttl, _ = entry
+    return monotonic() - inserted_at < ttl
+
+
+def _memoise_derived(*source_caches):
+    # Remembers a ratio until any of the cache entries it was worked out from is replaced or expires
+    def decorator(getter):
+        name = getter.__name__
+
+        @functools.wraps(getter)
+        def wrapper(self, tidm, market='LSE'):
+            if self.disable_all_caching:
+                return getter(self, tidm, market)
+
+            # This is the hot path for screens, so look everything up once and check the sources in a plain loop
+            cache_key = (tidm, market)
+            derived = self.derived_cache.get(cache_key)
+            if derived is not None:
+                derived = derived.get(name)
+            if derived is not None:
+                sources, value = derived
+                now = monotonic()
+                for cache_name, source in zip(source_caches, sources):
+                    if getattr(self, cache_name).get(cache_key) is not source or now - source[0] >= source[1]:
+                        break
+                else:
+                    return value
+
+            value = getter(self, tidm, market)
+
+            # Only remember results that were worked out from real cache entries, not from a failed download's fallback
+            sources = tuple(getattr(self, cache_name).get(cache_key) for cache_name in source_caches)
+            if all(source is not None for source in sources):
+                self.derived_cache.setdefault(cache_key, {})[name] = (sources, value)
+            return value
+        return wrapper
+    return decorator
+
 
 class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     disable_all_caching = False
 
-    # Seconds that we allow a price to stay valid for in the cache
-    # Currently 5 mins (300 Seconds)
+    # Seconds that entries stay valid in each cache. Use set_ttl_policy() for anything more involved
+    market_hours_price_cache_age = 30
+    out_of_hours_price_cache_age = 3600
+    # Deprecated: if set, used for prices at all hours in place of the two ages above
+    maximum_price_cache_age = None
+    maximum_income_cache_age = 86400
+    maximum_balance_cache_age = 86400
+    maximum_summary_cache_age = 86400
+    ttl_policy = None
+
+    # Downloaded pages are kept briefly by url, so the price and summary sheet share one download
+    raw_html_cache_age = 10
+
+    MARKET_TIMEZONE = ZoneInfo('Europe/London')
+    MARKET_OPEN = time(8, 0)
+    MARKET_CLOSE = time(16, 30)
+
+    # Most keys each cache holds before the least recently used is dropped
+    max_cache_entries = 1024
 
-    maximum_price_cache_age = 300
-    price_cache = {}
+    # Shared by every instance for prefetch(). No threads are started until the first prefetch.
+    prefetch_executor = ThreadPoolExecutor(max_workers=16)
 
-    income_cache = {}
-    balance_cache = {}
-    summary_cache = {}
+    # Directory to persist the caches to between runs. None keeps them in memory only
+    persistent_cache_dir = None
+    PERSISTED_CACHES = ('price_cache', 'income_cache', 'balance_cache', 'summary_cache')
 
     INCOME_URL = 'https://markets.investorschronicle.co.uk/data/equities/tearsheet/financials?s={TIDM}:{MARKET}&subview=IncomeStatement'
     BALANCE_URL = 'https://markets.investorschronicle.co.uk/data/equities/tearsheet/financials?s={TIDM}:{MARKET}&subview=BalanceSheet'
     SUMMARY_URL = 'https://markets.investorschronicle.co.uk/data/equities/tearsheet/summary?s={TIDM}:{MARKET}'
 
+    # pd.read_html parser for the sheets. The IC pages are well-formed, so lxml is enough.
+    HTML_FLAVOR = 'lxml'
+
+    def __init__(self, persistent_cache_dir=None, max_cache_entries=None):
+        if persistent_cache_dir is not None:
+            self.persistent_cache_dir = persistent_cache_dir
+        if max_cache_entries is not None:
+            self.max_cache_entries = max_cache_entries
+        if self.maximum_price_cache_age is not None:
+            log.warning('maximum_price_cache_age is deprecated, use market_hours_price_cache_age and out_of_hours_price_cache_age instead.')
+
+        self.price_cache = OrderedDict()
+        self.income_cache = OrderedDict()
+        self.balance_cache = OrderedDict()
+        self.summary_cache = OrderedDict()
+        self.raw_html_cache = OrderedDict()
+        self.__cache_lock = threading.Lock()
+
+        # cache key -> {getter name: (source cache entries, value)}, see _memoise_derived()
+        self.derived_cache = {}
+
+        # key -> Future for downloads in progress, so concurrent misses for a key share one download
+        self.__inflight = {'price_cache': {}, 'income_cache': {}, 'balance_cache': {}, 'summary_cache': {}, 'raw_html_cache': {}}
+        self.__inflight_lock = threading.Lock()
+
+        if self.persistent_cache_dir is not None:
+            for cache_name in self.PERSISTED_CACHES:
+                cache = getattr(self, cache_name)
+                cache.update(self.__load_persisted_cache(cache_name))
+                while len(cache) > self.max_cache_entries:
+                    cache.popitem(last=False)
+
+    # ======================================================================================================================================================================================
+
+    def __persisted_cache_path(self, cache_name):
+        return os.path.join(self.persistent_cache_dir, '{0}.pkl.gz'.format(cache_name))
+
+    def __load_persisted_cache(self, cache_name):
+        path = self.__persisted_cache_path(cache_name)
+        cache = {}
+        if not os.path.exists(path):
+            return cache
+
+        # Replay the log; later records for a key replace earlier ones
+        records = 0
+        try:
+            with gzip.open(path, 'rb') as fh:
+                while True:
+                    try:
+                        key, value = pickle.load(fh)
+                    except EOFError:
+                        break
+                    # Keys used to be 'TIDM:MARKET' strings
+                    if isinstance(key, str):
+                        key = tuple(key.rsplit(':', 1))
+                    cache[key] = value
+                    records += 1
+        except (OSError, pickle.UnpicklingError, ValueError) as e:
+            log.error('Unable to read all of persisted cache %s, using the %s records read before the error: %s', path, records, e)
+
+        log.info('Loaded %s entries for %s from %s', len(cache), cache_name, path)
+
+        # Compact the log if it has built up superseded records
+        if records > len(cache):
+            log.info('Compacting persisted cache %s from %s records to %s', path, records, len(cache))
+            with gzip.open(path, 'wb') as fh:
+                for key, value in cache.items():
+                    pickle.dump((key, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Persisted times are wall-clock, so turn them back into monotonic ones, keeping their age
+        now, monotonic_now = datetime.now(), monotonic()
+        return {key: (monotonic_now - (now - inserted_at).total_seconds(), ttl, value)
+                for key, (inserted_at, ttl, value) in cache.items()}
+
+    def __persist_cache_entry(self, cache_name, key, value):
+        if self.persistent_cache_dir is None or cache_name not in self.PERSISTED_CACHES:
+            return
+
+        # Append rather than rewriting the whole file; each append is its own gzip member, which gzip reads back as one stream
+        os.makedirs(self.persistent_cache_dir, exist_ok=True)
+        with gzip.open(self.__persisted_cache_path(cache_name), 'ab') as fh:
+            pickle.dump((key, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # ======================================================================================================================================================================================
+
+    def set_ttl_policy(self, ttl_policy):
+        # ttl_policy(cache_name, now) returns the seconds a new entry stays valid. None restores the default
+        self.ttl_policy = ttl_policy
+
+    def default_ttl_policy(self, cache_name, now):
+        if cache_name == 'price_cache':
+            return self.__price_ttl(now)
+        if cache_name == 'raw_html_cache':
+            return self.raw_html_cache_age
+        # e.g. 'income_cache' -> maximum_income_cache_age
+        return getattr(self, 'maximum_{0}_age'.format(cache_name))
+
+    def __price_ttl(self, now):
+        if self.maximum_price_cache_age is not None:
+            return self.maximum_price_cache_age
+
+        market_now = now.astimezone(self.MARKET_TIMEZONE)
+        if market_now.weekday() < 5 and self.MARKET_OPEN <= market_now.time() <= self.MARKET_CLOSE:
+            return self.market_hours_price_cache_age
+
+        # Don't let a price cached out of hours outlive the next open
+        next_open = datetime.combine(market_now.date(), self.MARKET_OPEN, tzinfo=self.MARKET_TIMEZONE)
+        if market_now.time() >= self.MARKET_OPEN:
+            next_open += timedelta(days=1)
+        while next_open.weekday() >= 5:
+            next_open += timedelta(days=1)
+        return min(self.out_of_hours_price_cache_age, next_open.timestamp() - market_now.timestamp())
+
+    def __get_fresh_cache_entry(self, cache_name, key):
+        cache = getattr(self, cache_name)
+        with self.__cache_lock:
+            entry = cache.get(key)
+            if entry is None:
+                return None
+            cache.move_to_end(key)
+
+        if not _is_fresh(entry):
+            log.info('%s in %s is older than its TTL of %s seconds, ignoring it.', key, cache_name, entry[1])
+            return None
+
+        return entry[2]
+
+    def __put_cache_entry(self, cache_name, key, value):
+        now = datetime.now()
+        ttl_policy = self.ttl_policy or self.default_ttl_policy
+        ttl = ttl_policy(cache_name, now)
+        entry = (monotonic(), ttl, value)
+        cache = getattr(self, cache_name)
+        with self.__cache_lock:
+            cache[key] = entry
+            cache.move_to_end(key)
+            while len(cache) > self.max_cache_entries:
+                evicted_key, _ = cache.popitem(last=False)
+                log.info('%s is full, dropping least recently used %s.', cache_name, evicted_key)
+                # Don't let ratios worked out from the dropped entry keep it alive
+                self.derived_cache.pop(evicted_key, None)
+        self.__persist_cache_entry(cache_name, key, (now, ttl, value))
+
+    def __single_flight(self, cache_name, key, download):
+        with self.__inflight_lock:
+            future = self.__inflight[cache_name].get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.__inflight[cache_name][key] = future
+
+        if not is_owner:
+            log.info('%s for %s is already being downloaded, waiting for that instead.', cache_name, key)
+            return future.result()
+
+        try:
+            result = download()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.__inflight_lock:
+                del self.__inflight[cache_name][key]
+
+    def __get_raw_html(self, url):
+        if self.disable_all_caching:
+            return self.download_web_page(url)
+
+        raw_html = self.__get_fresh_cache_entry('raw_html_cache', url)
+        if raw_html is not None:
+            log.info('Using page downloaded moments ago from %s', url)
+            return raw_html
+
+        return self.__single_flight('raw_html_cache', url, lambda: self.__download_raw_html(url))
+
+    def __download_raw_html(self, url):
+        raw_html = self.download_web_page(url)
+        # Failed downloads come back empty; don't hold on to those
+        if raw_html:
+            self.__put_cache_entry('raw_html_cache', url, raw_html)
+        return raw_html
+
+    # ======================================================================================================================================================================================
+
     def __format_ic_income_dataframe(self, df_income):
         income_lines_column_name = df_income.columns[0]
-        log.info('Renaming income sheet column [{0}] to [{1}]'.format(income_lines_column_name, IC_INCOME_DATA.NEW_INCOME_LINE_ITEM_COLUMN_NAME))
+        log.info('Renaming income sheet column [%s] to [%s]', income_lines_column_name, IC_INCOME_DATA.NEW_INCOME_LINE_ITEM_COLUMN_NAME)
         df_income = df_income.rename(columns={income_lines_column_name: IC_INCOME_DATA.NEW_INCOME_LINE_ITEM_COLUMN_NAME})
         df_income.set_index(IC_INCOME_DATA.NEW_INCOME_LINE_ITEM_COLUMN_NAME, inplace=True)
 
         # Need to replace all figures in parentheses as - (minus) numbers so we can convert to numeric later
-        for col in df_income.columns:
-            df_income[col] = df_income[col].replace( '[\$,)]', '', regex=True ).replace('[(]', '-', regex=True)
-
-        df_income = df_income.apply(pd.to_numeric, errors='coerce').dropna(how='all')
+        df_income = _clean_figures(df_income).dropna(how='all')
         return df_income
 
     # ======================================================================================================================================================================================
 
     def __format_ic_balance_dataframe(self, df_balance):
         income_lines_column_name = df_balance.columns[0]
-        log.info('Renaming balance sheet column [{0}] to [{1}]'.format(income_lines_column_name, IC_BALANCE_DATA.NEW_BALANCE_LINE_ITEM_COLUMN_NAME))
+        log.info('Renaming balance sheet column [%s] to [%s]', income_lines_column_name, IC_BALANCE_DATA.NEW_BALANCE_LINE_ITEM_COLUMN_NAME)
         df_balance = df_balance.rename(columns={income_lines_column_name: IC_BALANCE_DATA.NEW_BALANCE_LINE_ITEM_COLUMN_NAME})
 
-        # Need to replace all figures in parentheses as - (minus) numbers so we can convert to numeric later
-        for col in df_balance.columns:
-            df_balance[col] = df_balance[col].replace( '[\$,)]', '', regex=True ).replace('[(]', '-', regex=True)
-
         df_balance.set_index(IC_BALANCE_DATA.NEW_BALANCE_LINE_ITEM_COLUMN_NAME, inplace=True)
-        df_balance = df_balance.apply(pd.to_numeric, errors='coerce').dropna(how='all')
+
+        # Need to replace all figures in parentheses as - (minus) numbers so we can convert to numeric later
+        df_balance = _clean_figures(df_balance).dropna(how='all')
         return df_balance
 
     # ======================================================================================================================================================================================
 
     def __format_ic_summary_dataframe(self, df_summary):
-        log.info('Renaming summary sheet columns from 0 and 1 to [{0}] and [{1}]'.format(IC_SUMMARY_DATA.NEW_SUMMARY_LINE_ITEM_COLUMN_NAME, IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME))
+        log.info('Renaming summary sheet columns from 0 and 1 to [%s] and [%s]', IC_SUMMARY_DATA.NEW_SUMMARY_LINE_ITEM_COLUMN_NAME, IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME)
         df_summary = df_summary.rename(columns={0: IC_SUMMARY_DATA.NEW_SUMMARY_LINE_ITEM_COLUMN_NAME, 1: IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME})
         df_summary.set_index(IC_SUMMARY_DATA.NEW_SUMMARY_LINE_ITEM_COLUMN_NAME, inplace=True)
         return df_summary
@@ -61,159 +384,190 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
     # ======================================================================================================================================================================================
 
     def get_ic_income_sheet(self, tidm, market='LSE'):
-        # Pull from cache first if it exists
-        cache_key = '{0}:{1}'.format(tidm, market)
-        if not self.disable_all_caching and cache_key in self.income_cache.keys():
-            log.info('Found {0} in income sheet cache, returning cached version of sheet instead'.format(cache_key))
-            return self.income_cache[cache_key]
-
-        log.info('{0} not found in income sheet cache, getting from website.'.format(cache_key))
-
-        url = self.INCOME_URL.format(TIDM=tidm, MARKET=market)
-        log.info('Calling following URL for {0} income sheet: {1}'.format(tidm, url))
-        raw_html = self.download_web_page(url)
-        log.info('Extracting tables from {0} income sheet'.format(tidm))
-        html_tables = self.extract_tables_from_raw_html(raw_html)
-        log.info('Extracted {0} tables.'.format(len(html_tables)))
+        return self.__get_ic_income_sheet(tidm, market).df
 
-        income_dataframes = self.get_dataframes_from_html_tables(html_tables)
+    def __get_ic_income_sheet(self, tidm, market):
+        return self.__get_ic_sheet('income', self.INCOME_URL, tidm, market, self.__build_ic_income_sheet, use_cache=not self.disable_all_caching)
 
+    def __build_ic_income_sheet(self, income_dataframes):
         # There should only be one DataFrame returned, really
         if len(income_dataframes) > 1:
-            log.warning('There appear to be more than 1 dataframes in the list returned for the income sheet: {0}'.format(len(income_dataframes)))
+            log.warning('There appear to be more than 1 dataframes in the list returned for the income sheet: %s', len(income_dataframes))
 
         df_income = income_dataframes[IC_INCOME_DATA.INCOME_DATA_FRAME_INDEX]
         df_income = self.__format_ic_income_dataframe(df_income)
-
-        # Add to cache for later
-        self.income_cache['{0}:{1}'.format(tidm, market)] = df_income
-        return df_income
+        return _make_sheet(df_income, df_income.columns.max())
 
     # ======================================================================================================================================================================================
 
     def get_ic_balance_sheet(self, tidm, market='LSE'):
-        # Pull from cache first if it exists
-        cache_key = '{0}:{1}'.format(tidm, market)
-        if not self.disable_all_caching and cache_key in self.balance_cache.keys():
-            log.info('Found {0} in balance sheet cache, returning cached version of sheet instead'.format(cache_key))
-            return self.balance_cache[cache_key]
+        return self.__get_ic_balance_sheet(tidm, market).df
 
-        log.info('{0} not found in balance sheet cache, getting from website.'.format(cache_key))
-
-        url = self.BALANCE_URL.format(TIDM=tidm, MARKET=market)
-        log.info('Calling following URL for {0} balance sheet: {1}'.format(tidm, url))
-        raw_html = self.download_web_page(url)
-        log.info('Extracting tables from {0} balance sheet'.format(tidm))
-        html_tables = self.extract_tables_from_raw_html(raw_html)
-        log.info('Extracted {0} tables.'.format(len(html_tables)))
-
-        balance_dataframes = self.get_dataframes_from_html_tables(html_tables)
+    def __get_ic_balance_sheet(self, tidm, market):
+        return self.__get_ic_sheet('balance', self.BALANCE_URL, tidm, market, self.__build_ic_balance_sheet, use_cache=not self.disable_all_caching)
 
+    def __build_ic_balance_sheet(self, balance_dataframes):
         # There should only be one DataFrame returned, really
         if len(balance_dataframes) > 1:
-            log.warning('There appear to be more than 1 dataframes in the list returned for the balance sheet: {0}'.format(len(balance_dataframes)))
+            log.warning('There appear to be more than 1 dataframes in the list returned for the balance sheet: %s', len(balance_dataframes))
 
         df_balance = balance_dataframes[IC_BALANCE_DATA.BALANCE_DATA_FRAME_INDEX]
         df_balance = self.__format_ic_balance_dataframe(df_balance)
-
-        self.balance_cache['{0}:{1}'.format(tidm, market)] = df_balance
-        return df_balance
+        return _make_sheet(df_balance, df_balance.columns.max())
 
     # ======================================================================================================================================================================================
 
     def get_ic_summary_sheet(self, tidm, market='LSE'):
-        # Pull from cache first if it exists
-        cache_key = '{0}:{1}'.format(tidm, market)
-        if cache_key in self.summary_cache.keys():
-            log.info('Found {0} in summary sheet cache, returning cached version of sheet instead'.format(cache_key))
-            return self.summary_cache[cache_key]
-
-        log.info('{0} not found in summary sheet cache, getting from website.'.format(cache_key))
-
-        url = self.SUMMARY_URL.format(TIDM=tidm, MARKET=market)
-        log.info('Calling following URL for {0} summary sheet: {1}'.format(tidm, url))
-        raw_html = self.download_web_page(url)
-        log.info('Extracting tables from {0} summary sheet'.format(tidm))
-        html_tables = self.extract_tables_from_raw_html(raw_html)
-        log.info('Extracted {0} tables.'.format(len(html_tables)))
+        return self.__get_ic_summary_sheet(tidm, market).df
 
-        summary_dataframes = self.get_dataframes_from_html_tables(html_tables, headers=None)
+    def __get_ic_summary_sheet(self, tidm, market):
+        return self.__get_ic_sheet('summary', self.SUMMARY_URL, tidm, market, self.__build_ic_summary_sheet, headers=None)
 
+    def __build_ic_summary_sheet(self, summary_dataframes):
         # There should be 3 DataFrames returned for this page but they can all be merged into 1 as it's just 'Item'|'Value'
         if len(summary_dataframes) > 3:
-            log.warning('There appear to be more than 3 dataframes in the list returned for the summary sheet: {0}'.format(len(summary_dataframes)))
+            log.warning('There appear to be more than 3 dataframes in the list returned for the summary sheet: %s', len(summary_dataframes))
 
         log.info('Merging all Dataframes into 1')
-        merged_summaries = pd.concat(summary_dataframes)
+        columns = summary_dataframes[0].columns
+        if all(df.columns.equals(columns) for df in summary_dataframes):
+            # The usual case, where they're all 'Item'|'Value' tables: stack their values in one go and skip concat's alignment
+            merged_summaries = pd.DataFrame(np.vstack([df.to_numpy(dtype=object) for df in summary_dataframes]), columns=columns)
+        else:
+            merged_summaries = pd.concat(summary_dataframes)
 
         log.info('Formatting final Dataframe.')
         merged_formatted_summaries = self.__format_ic_summary_dataframe(merged_summaries)
+        return _make_sheet(merged_formatted_summaries, IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME)
 
-        self.summary_cache['{0}:{1}'.format(tidm, market)] = merged_formatted_summaries
-        return merged_formatted_summaries
+    # ======================================================================================================================================================================================
+
+    def __get_ic_sheet(self, sheet_name, url_template, tidm, market, build_sheet, headers=0, use_cache=True):
+        # Shared by the three sheets: build_sheet turns the page's tables into the Sheet that is cached
+        cache_name = '{0}_cache'.format(sheet_name)
+        cache_key = (tidm, market)
+
+        # Pull from cache first if it exists
+        if use_cache:
+            sheet = self.__get_fresh_cache_entry(cache_name, cache_key)
+            if sheet is not None:
+                log.info('Found %s in %s sheet cache, returning cached version of sheet instead', cache_key, sheet_name)
+                return sheet
+
+        log.info('%s not found in %s sheet cache, getting from website.', cache_key, sheet_name)
+        return self.__single_flight(cache_name, cache_key,
+                                    lambda: self.__download_ic_sheet(sheet_name, url_template, tidm, market, cache_key, build_sheet, headers))
+
+    def __download_ic_sheet(self, sheet_name, url_template, tidm, market, cache_key, build_sheet, headers):
+        url = url_template.format(TIDM=tidm, MARKET=market)
+        log.info('Calling following URL for %s %s sheet: %s', tidm, sheet_name, url)
+        raw_html = self.__get_raw_html(url)
+        log.info('Extracting tables from %s %s sheet', tidm, sheet_name)
+        dataframes = self.get_dataframes_from_html(raw_html, headers=headers, flavor=self.HTML_FLAVOR)
+        log.info('Extracted %s tables.', len(dataframes))
+
+        sheet = build_sheet(dataframes)
+
+        # Add to cache for later
+        self.__put_cache_entry('{0}_cache'.format(sheet_name), cache_key, sheet)
+        return sheet
 
     # ======================================================================================================================================================================================
 
     def get_current_ic_price(self, tidm, market='LSE'):
         # Pull from cache first if it exists and is young enough
-        cache_key = '{0}:{1}'.format(tidm, market)
-        if cache_key in self.price_cache.keys():
-            log.info('Found {0} in price cache. Checking age.'.format(cache_key))
-            cached_price = self.price_cache[cache_key]
-            delta = datetime.now() - cached_price[0]
-            log.info('Ages is {0} seconds'.format(delta.seconds))
-            if delta.seconds <= self.maximum_price_cache_age:
-                log.info('Age is less than current maximum of {0}, so using cached version.'.format(self.maximum_price_cache_age))
-                return self.price_cache[cache_key][1]
+        cache_key = (tidm, market)
+        cached_price = self.__get_fresh_cache_entry('price_cache', cache_key)
+        if cached_price is not None:
+            log.info('Found %s in price cache within its TTL, so using cached version.', cache_key)
+            return cached_price
+
+        return self.__single_flight('price_cache', cache_key, lambda: self.__download_current_ic_price(tidm, market, cache_key))
 
+    def __download_current_ic_price(self, tidm, market, cache_key):
         url = self.SUMMARY_URL.format(TIDM=tidm, MARKET=market)
-        log.info('Calling following URL for {0} price: {1}'.format(tidm, url))
-        raw_html = self.download_web_page(url)
+        log.info('Calling following URL for %s price: %s', tidm, url)
+        raw_html = self.__get_raw_html(url)
 
-        start_pos = raw_html.find(IC_SUMMARY_DATA.PRICE_START_SEARCH_STRING)
-        if start_pos == -1:
-            log.error('Couldn''t find the start_pos search pattern in the html returned.')
+        price_match = IC_SUMMARY_DATA.PRICE_RE.search(raw_html)
+        if price_match is None:
+            log.error('Couldn''t find the price in the html returned.')
             return 0.0
 
-        start_pos = start_pos + len(IC_SUMMARY_DATA.PRICE_START_SEARCH_STRING)
-        end_pos = raw_html.find(IC_SUMMARY_DATA.PRICE_END_SEARCH_STRING, start_pos)
+        price = float(price_match.group(1).replace(',', ''))
+        self.__put_cache_entry('price_cache', cache_key, price)
+        return price
 
-        if end_pos == -1:
-            log.error('Couldn''t find the end_pos search pattern in the html returned.')
-            return 0.0
+    # ======================================================================================================================================================================================
 
-        price = float(raw_html[start_pos:end_pos].replace(',', ''))
-        self.price_cache[cache_key] = (datetime.now(), price)
-        return price
+    def prefetch(self, tidm, market='LSE'):
+        # Download all three sheets concurrently so later ratio getters hit the cache. Raises the first error
+        log.info('Prefetching Investors Chronicle sheets for %s', tidm)
+        futures = [self.prefetch_executor.submit(getter, tidm, market)
+                   for getter in (self.get_ic_income_sheet, self.get_ic_balance_sheet, self.get_ic_summary_sheet)]
+        for future in futures:
+            future.result()
+
+    def __fetch_concurrently(self, tidm, market, *getters):
+        # Runs the getters concurrently. Only pass ones that don't use the prefetch pool themselves
+        futures = [self.prefetch_executor.submit(getter, tidm, market) for getter in getters[1:]]
+        first = getters[0](tidm, market)
+        return [first] + [future.result() for future in futures]
+
+    # ======================================================================================================================================================================================
+
+    # Async versions of the getters, each running the normal getter on a worker thread
+
+    async def get_ic_income_sheet_async(self, tidm, market='LSE'):
+        return await asyncio.to_thread(self.get_ic_income_sheet, tidm, market)
+
+    async def get_ic_balance_sheet_async(self, tidm, market='LSE'):
+        return await asyncio.to_thread(self.get_ic_balance_sheet, tidm, market)
+
+    async def get_ic_summary_sheet_async(self, tidm, market='LSE'):
+        return await asyncio.to_thread(self.get_ic_summary_sheet, tidm, market)
+
+    async def get_current_ic_price_async(self, tidm, market='LSE'):
+        return await asyncio.to_thread(self.get_current_ic_price, tidm, market)
+
+    async def prefetch_async(self, tidms, market='LSE'):
+        # Fill all four caches for every tidm in one concurrent burst, so the ratio getters afterwards are all cache hits
+        log.info('Prefetching Investors Chronicle data for %s tidms', len(tidms))
+        await asyncio.gather(*[getter(tidm, market)
+                               for tidm in tidms
+                               for getter in (self.get_ic_income_sheet_async, self.get_ic_balance_sheet_async,
+                                              self.get_ic_summary_sheet_async, self.get_current_ic_price_async)])
 
     # ======================================================================================================================================================================================
 
     def get_date_of_latest_income_sheet(self, tidm, market='LSE'):
-        df_income = self.get_ic_income_sheet(tidm, market)
-        return df_income.columns.max()
+        return self.__get_ic_income_sheet(tidm, market).latest_col
 
     # ======================================================================================================================================================================================
 
     def get_date_of_latest_balance_sheet(self, tidm, market='LSE'):
-        df_balance = self.get_ic_balance_sheet(tidm, market)
-        return df_balance.columns.max()
+        return self.__get_ic_balance_sheet(tidm, market).latest_col
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('income_cache', 'balance_cache')
     def get_roce_pct(self, tidm, market='LSE'):
-        df_income = self.get_ic_income_sheet(tidm, market)
-        df_balance = self.get_ic_balance_sheet(tidm, market)
+        income, balance = self.__fetch_concurrently(tidm, market, self.__get_ic_income_sheet, self.__get_ic_balance_sheet)
 
-        latest_data = max(df_income.columns)
+        # The balance sheet is read at the income sheet's latest date, as it always has been, which is normally its latest too
+        if balance.latest_col == income.latest_col:
+            balance_figures = balance.latest
+        else:
+            balance_figures = balance.df[income.latest_col]
 
-        income_before_tax = df_income.loc[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES][latest_data]
-        log.info('Got income before tax for {0} at {1}'.format(tidm, income_before_tax))
+        income_before_tax = income.latest[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES]
+        log.info('Got income before tax for %s at %s', tidm, income_before_tax)
 
-        total_assets = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_ASSETS][latest_data]
-        log.info('Got total assets for {0} at {1}'.format(tidm, total_assets))
+        total_assets = balance_figures[IC_BALANCE_DATA.ROW_TOTAL_ASSETS]
+        log.info('Got total assets for %s at %s', tidm, total_assets)
 
-        current_liabilities = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_LIABILITIES][latest_data]
-        log.info('Got current liabilities for {0} at {1}'.format(tidm, current_liabilities))
+        current_liabilities = balance_figures[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_LIABILITIES]
+        log.info('Got current liabilities for %s at %s', tidm, current_liabilities)
 
         captial_employed = total_assets - current_liabilities
         roce = income_before_tax / captial_employed
@@ -222,28 +576,30 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache')
     def get_shares_outstanding(self, tidm, market='LSE'):
-        df_summary = self.get_ic_summary_sheet(tidm, market)
-        str_shares_outstanding = df_summary.loc[IC_SUMMARY_DATA.ROW_SHARES_OUTSTANDING][IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME]
-        log.info('Got Shares Outstanding value for {0}: {1}'.format(tidm, str_shares_outstanding))
-        shares_outstanding_unit = str_shares_outstanding[-1:].upper()
-        log.info('Unit is: {0}'.format(shares_outstanding_unit))
-
-        if shares_outstanding_unit == 'M':
-            shares_outstanding = float(str_shares_outstanding[:-1]) * 1000000
-        elif shares_outstanding_unit == 'N':
-            shares_outstanding = float(str_shares_outstanding[:-2]) * 1000000000
-        else:
-            log.error('Unrecognised unit used for Shares Outstanding for {0}: {1}'.format(tidm, shares_outstanding_unit))
-            shares_outstanding = 0
+        return self.__shares_outstanding(tidm, self.__get_ic_summary_sheet(tidm, market))
+
+    def __shares_outstanding(self, tidm, summary):
+        str_shares_outstanding = summary.latest[IC_SUMMARY_DATA.ROW_SHARES_OUTSTANDING]
+        log.info('Got Shares Outstanding value for %s: %s', tidm, str_shares_outstanding)
+        # The figure is followed by its unit, e.g. '150.50m' or '1.2bn'
+        str_number = str_shares_outstanding.rstrip(IC_SUMMARY_DATA.UNIT_LETTERS)
+        shares_outstanding_unit = str_shares_outstanding[len(str_number):].lower()
+        log.info('Unit is: %s', shares_outstanding_unit)
+
+        multiplier = IC_SUMMARY_DATA.UNIT_MULTIPLIERS.get(shares_outstanding_unit)
+        if multiplier is None:
+            log.error('Unrecognised unit used for Shares Outstanding for %s: %s', tidm, shares_outstanding_unit)
+            return 0
 
-        return shares_outstanding
+        return float(str_number) * multiplier
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache')
     def get_price_to_earnings_ratio_ttm(self, tidm, market='LSE'):
-        df_summary = self.get_ic_summary_sheet(tidm, market)
-        str_price_to_earnings_ratio_ttm = df_summary.loc[IC_SUMMARY_DATA.ROW_P_E_TTM_][IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME]
+        str_price_to_earnings_ratio_ttm = self.__get_ic_summary_sheet(tidm, market).latest[IC_SUMMARY_DATA.ROW_P_E_TTM_]
         if str_price_to_earnings_ratio_ttm == '--':
             return 0
 
@@ -251,21 +607,26 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache', 'income_cache', 'price_cache')
     def get_price_to_earnings_ratio(self, tidm, market='LSE'):
-        log.info('Calculating price to earnings ratio for {0}')
-        eps = self.get_eps(tidm, market)
-        log.info('EPS for {0} is: '.format(eps))
-        price = (self.get_current_ic_price(tidm, market)) / 100
-        log.info('Price for {0} is: {1}'.format(tidm, price))
+        log.info('Calculating price to earnings ratio for %s', tidm)
+        summary, income, price = self.__fetch_concurrently(tidm, market, self.__get_ic_summary_sheet, self.__get_ic_income_sheet, self.get_current_ic_price)
+        eps = self.__eps(tidm, summary, income)
+        log.info('EPS for %s is: %s', tidm, eps)
+        price = price / 100
+        log.info('Price for %s is: %s', tidm, price)
 
         per = price / eps
         return per
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache')
     def get_eps_ttm(self, tidm, market='LSE'):
-        df_summary = self.get_ic_summary_sheet(tidm, market)
-        str_eps_ttm = df_summary.loc[IC_SUMMARY_DATA.ROW_EPS_TTM_][IC_SUMMARY_DATA.NEW_SUMMARY_VALUE_COLUMN_NAME]
+        return self.__eps_ttm(self.__get_ic_summary_sheet(tidm, market))
+
+    def __eps_ttm(self, summary):
+        str_eps_ttm = summary.latest[IC_SUMMARY_DATA.ROW_EPS_TTM_]
         if str_eps_ttm == '--':
             return 0.0
 
@@ -274,14 +635,17 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache', 'income_cache')
     def get_eps(self, tidm, market='LSE'):
-        log.info('Getting EPS for {0}'.format(tidm))
-        shares_outstanding = self.get_shares_outstanding(tidm, market)
-        log.info('Shares Outstanding for {0} is: {1}'.format(tidm, shares_outstanding))
-        df_income = self.get_ic_income_sheet(tidm, market)
-        latest_data = max(df_income.columns)
-        ebit = float(df_income.loc[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES][latest_data]) * 1000000
-        log.info('EBIT for {0} is: {1}'.format(tidm, ebit))
+        log.info('Getting EPS for %s', tidm)
+        summary, income = self.__fetch_concurrently(tidm, market, self.__get_ic_summary_sheet, self.__get_ic_income_sheet)
+        return self.__eps(tidm, summary, income)
+
+    def __eps(self, tidm, summary, income):
+        shares_outstanding = self.__shares_outstanding(tidm, summary)
+        log.info('Shares Outstanding for %s is: %s', tidm, shares_outstanding)
+        ebit = float(income.latest[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES]) * 1000000
+        log.info('EBIT for %s is: %s', tidm, ebit)
 
         # Price is in Pence, remember
         eps = ebit / shares_outstanding
@@ -289,6 +653,7 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache', 'price_cache')
     def get_earnings_yield_pct_ttm(self, tidm, market='LSE'):
         eps_ttm = self.get_eps_ttm(tidm, market)
         if eps_ttm == 0:
@@ -301,9 +666,10 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('summary_cache', 'income_cache', 'price_cache')
     def get_earnings_yield_pct(self, tidm, market='LSE'):
-        eps = self.get_eps(tidm, market)
-        price = self.get_current_ic_price(tidm, market)
+        summary, income, price = self.__fetch_concurrently(tidm, market, self.__get_ic_summary_sheet, self.__get_ic_income_sheet, self.get_current_ic_price)
+        eps = self.__eps(tidm, summary, income)
 
         # Price is in Pence, remember
         ey = eps / (price / 100)
@@ -311,87 +677,152 @@ class InvestorsChronicleInterface(FinancialWebsiteInterface):
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('balance_cache')
     def get_total_debt(self, tidm, market='LSE'):
-        df_balance = self.get_ic_balance_sheet(tidm, market)
-        latest_data = max(df_balance.columns)
-        str_total_debt = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_DEBT][latest_data]
+        balance = self.__get_ic_balance_sheet(tidm, market).latest
+        str_total_debt = balance[IC_BALANCE_DATA.ROW_TOTAL_DEBT]
         return float(str_total_debt)
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('balance_cache')
     def get_current_ratio(self, tidm, market='LSE'):
-        df_balance = self.get_ic_balance_sheet(tidm, market)
-        latest_data = max(df_balance.columns)
-        current_liabilities = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_LIABILITIES][latest_data]
-        current_assets = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_ASSETS][latest_data]
+        balance = self.__get_ic_balance_sheet(tidm, market).latest
+        current_liabilities = balance[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_LIABILITIES]
+        current_assets = balance[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_ASSETS]
         current_ratio = float(current_assets) / float(current_liabilities)
         return current_ratio
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('balance_cache')
     def get_nav(self, tidm, market='LSE'):
-        df_balance = self.get_ic_balance_sheet(tidm, market)
-        latest_data = max(df_balance.columns)
+        return self.__nav(self.__get_ic_balance_sheet(tidm, market))
+
+    def __nav(self, balance):
+        balance = balance.latest
 
-        total_assets = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_ASSETS][latest_data]
-        total_liabilities = df_balance.loc[IC_BALANCE_DATA.ROW_TOTAL_LIABILITIES][latest_data]
+        total_assets = balance[IC_BALANCE_DATA.ROW_TOTAL_ASSETS]
+        total_liabilities = balance[IC_BALANCE_DATA.ROW_TOTAL_LIABILITIES]
 
         net_asset_value = float(total_assets) - float(total_liabilities)
         return net_asset_value
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('balance_cache', 'summary_cache')
     def get_nav_per_share(self, tidm, market='LSE'):
-        log.info('Calculating NAV Per Share for {0}'.format(tidm))
-        nav = self.get_nav(tidm, market) * 1000000
-        log.info('NAV for {0}: {1}'.format(tidm, nav))
-        shares_outstanding = self.get_shares_outstanding(tidm, market)
-        log.info('Shares outstanding for {0}: {1}'.format(tidm, shares_outstanding))
+        log.info('Calculating NAV Per Share for %s', tidm)
+        balance, summary = self.__fetch_concurrently(tidm, market, self.__get_ic_balance_sheet, self.__get_ic_summary_sheet)
+        return self.__nav_per_share(tidm, balance, summary)
+
+    def __nav_per_share(self, tidm, balance, summary):
+        nav = self.__nav(balance) * 1000000
+        log.info('NAV for %s: %s', tidm, nav)
+        shares_outstanding = self.__shares_outstanding(tidm, summary)
+        log.info('Shares outstanding for %s: %s', tidm, shares_outstanding)
         nav_per_share = nav / float(shares_outstanding)
         return nav_per_share
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('balance_cache', 'summary_cache', 'price_cache')
     def get_nav_per_share_as_pct_of_price(self, tidm, market='LSE'):
-        nav_per_share = self.get_nav_per_share(tidm, market)
+        balance, summary, price = self.__fetch_concurrently(tidm, market, self.__get_ic_balance_sheet, self.__get_ic_summary_sheet, self.get_current_ic_price)
+        nav_per_share = self.__nav_per_share(tidm, balance, summary)
         # Remember, price is in GBX
-        price = self.get_current_ic_price(tidm, market) / 100
+        price = price / 100
         pct = (nav_per_share / price)
         return pct
 
     # ======================================================================================================================================================================================
 
+    @_memoise_derived('price_cache', 'summary_cache')
     def get_market_cap(self, tidm, market='LSE'):
         price = self.get_current_ic_price(tidm, market) / 100
         shares_outstanding = self.get_shares_outstanding(tidm, market)
         market_cap = price * shares_outstanding
         return market_cap
 
+    # ======================================================================================================================================================================================
+
+    @_memoise_derived('income_cache', 'balance_cache', 'summary_cache', 'price_cache')
+    def snapshot(self, tidm, market='LSE'):
+        # Every figure the ratios need, read once. Use the getters when only one or two ratios are wanted
+        income, balance, summary, price = self.__fetch_concurrently(tidm, market, self.__get_ic_income_sheet, self.__get_ic_balance_sheet,
+                                                                   self.__get_ic_summary_sheet, self.get_current_ic_price)
+        income, balance = income.latest, balance.latest
+        return Snapshot(price=price,
+                        shares_outstanding=self.__shares_outstanding(tidm, summary),
+                        eps_ttm=self.__eps_ttm(summary),
+                        income_before_tax=float(income[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES]),
+                        total_assets=float(balance[IC_BALANCE_DATA.ROW_TOTAL_ASSETS]),
+                        total_liabilities=float(balance[IC_BALANCE_DATA.ROW_TOTAL_LIABILITIES]),
+                        current_assets=float(balance[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_ASSETS]),
+                        current_liabilities=float(balance[IC_BALANCE_DATA.ROW_TOTAL_CURRENT_LIABILITIES]),
+                        total_debt=float(balance[IC_BALANCE_DATA.ROW_TOTAL_DEBT]))
+
+    # ======================================================================================================================================================================================
+
+    def get_metrics_batch(self, tidms, market='LSE'):
+        # One row per tidm of snapshot figures and ratios. Tidms whose data can't be got are logged and left out
+        log.info('Getting metrics for %s tidms', len(tidms))
+
+        # Download everything up front on the prefetch pool, so the snapshots below are all built from the caches
+        wait([self.prefetch_executor.submit(getter, tidm, market)
+              for tidm in tidms
+              for getter in (self.__get_ic_income_sheet, self.__get_ic_balance_sheet, self.__get_ic_summary_sheet, self.get_current_ic_price)])
+
+        rows = {}
+        for tidm in tidms:
+            try:
+                rows[tidm] = asdict(self.snapshot(tidm, market))
+            except Exception as e:
+                log.error('Unable to get metrics for %s: %s', tidm, e)
+
+        df = pd.DataFrame.from_dict(rows, orient='index', columns=list(Snapshot.__dataclass_fields__))
+        price = df['price'] / 100
+        df['eps'] = df['income_before_tax'] * 1000000 / df['shares_outstanding']
+        df['price_to_earnings_ratio'] = price / df['eps']
+        df['earnings_yield_pct'] = df['eps'] / price
+        df['earnings_yield_pct_ttm'] = (df['eps_ttm'] / price).where(df['eps_ttm'] != 0, 0)
+        df['roce_pct'] = df['income_before_tax'] / (df['total_assets'] - df['current_liabilities'])
+        df['current_ratio'] = df['current_assets'] / df['current_liabilities']
+        df['nav'] = df['total_assets'] - df['total_liabilities']
+        df['nav_per_share'] = df['nav'] * 1000000 / df['shares_outstanding']
+        df['nav_per_share_as_pct_of_price'] = df['nav_per_share'] / price
+        df['market_cap'] = price * df['shares_outstanding']
+        return df
+
 # ======================================================================================================================================================================================
 
 class IC_SUMMARY_DATA:
-    PRICE_START_SEARCH_STRING = 'Price (GBX)</span><span class="mod-ui-data-list__value">'
-    PRICE_END_SEARCH_STRING = '</span>'
+    # Searched for in the summary page, in a single pass that captures the price
+    PRICE_RE = re.compile(r'Price \(GBX\)</span><span class="mod-ui-data-list__value">([^<]{1,64})</span>')
     NEW_SUMMARY_LINE_ITEM_COLUMN_NAME = 'Summary Line Item'
     NEW_SUMMARY_VALUE_COLUMN_NAME = 'Value'
 
+    # Units that large figures such as shares outstanding are given in
+    UNIT_MULTIPLIERS = {'k': 1000, 'm': 1000000, 'bn': 1000000000, 'tn': 1000000000000}
+    UNIT_LETTERS = 'kKmMbBnNtT'
+
     # DATA ROWS
-    ROW_OPEN = "Open"
-    ROW_HIGH = "High"
-    ROW_LOW = "Low"
-    ROW_BID = "Bid"
-    ROW_OFFER = "Offer"
-    ROW_PREVIOUS_CLOSE = "Previous close"
-    ROW_AVERAGE_VOLUME = "Average volume"
-    ROW_SHARES_OUTSTANDING = "Shares outstanding"
-    ROW_FREE_FLOAT = "Free float"
-    ROW_P_E_TTM_ = "P/E (TTM)"
-    ROW_MARKET_CAP = "Market cap"
-    ROW_EPS_TTM_ = "EPS (TTM)"
-    ROW_ANNUAL_DIV_ADY_ = "Annual div (ADY)"
-    ROW_ANNUAL_DIV_YIELD_ADY_ = "Annual div yield (ADY)"
-    ROW_DIV_EXDATE = "Div ex-date"
-    ROW_DIV_PAYDATE = "Div pay-date"
+    ROW_OPEN = sys.intern("Open")
+    ROW_HIGH = sys.intern("High")
+    ROW_LOW = sys.intern("Low")
+    ROW_BID = sys.intern("Bid")
+    ROW_OFFER = sys.intern("Offer")
+    ROW_PREVIOUS_CLOSE = sys.intern("Previous close")
+    ROW_AVERAGE_VOLUME = sys.intern("Average volume")
+    ROW_SHARES_OUTSTANDING = sys.intern("Shares outstanding")
+    ROW_FREE_FLOAT = sys.intern("Free float")
+    ROW_P_E_TTM_ = sys.intern("P/E (TTM)")
+    ROW_MARKET_CAP = sys.intern("Market cap")
+    ROW_EPS_TTM_ = sys.intern("EPS (TTM)")
+    ROW_ANNUAL_DIV_ADY_ = sys.intern("Annual div (ADY)")
+    ROW_ANNUAL_DIV_YIELD_ADY_ = sys.intern("Annual div yield (ADY)")
+    ROW_DIV_EXDATE = sys.intern("Div ex-date")
+    ROW_DIV_PAYDATE = sys.intern("Div pay-date")
 
 
 class IC_INCOME_DATA:
@@ -399,45 +830,45 @@ class IC_INCOME_DATA:
     NEW_INCOME_LINE_ITEM_COLUMN_NAME = 'Income Line Item'
 
     # DATA ROWS
-    ROW_TOTAL_REVENUE = "Total revenue"
-    ROW_COST_OF_REVENUE_TOTAL = "Cost of revenue total"
-    ROW_SELLING_GENERAL_AND_ADMIN_EXPENSES_TOTAL = "Selling, general and admin. expenses, total"
-    ROW_DEPRECIATION_AMORTIZATION = "Depreciation/amortization"
-    ROW_UNUSUAL_EXPENSE_INCOME_ = "Unusual expense(income)"
-    ROW_OTHER_OPERATING_EXPENSES_TOTAL = "Other operating expenses, total"
-    ROW_TOTAL_OPERATING_EXPENSE = "Total operating expense"
-    ROW_OPERATING_INCOME = "Operating income"
-    ROW_OTHER_NET = "Other, net"
-    ROW_NET_INCOME_BEFORE_TAXES = "Net income before taxes"
-    ROW_PROVISION_FOR_INCOME_TAXES = "Provision for income taxes"
-    ROW_NET_INCOME_AFTER_TAXES = "Net income after taxes"
-    ROW_MINORITY_INTEREST = "Minority interest"
-    ROW_NET_INCOME_BEFORE_EXTRA_ITEMS = "Net income before extra. Items"
-    ROW_TOTAL_EXTRAORDINARY_ITEMS = "Total extraordinary items"
-    ROW_NET_INCOME = "Net income"
-    ROW_INCAVAIL_TO_COMMON_EXCL_EXTRA_ITEMS = "Inc.avail. to common excl. extra. Items"
-    ROW_INCAVAIL_TO_COMMON_INCL_EXTRA_ITEMS = "Inc.avail. to common incl. extra. Items"
-    ROW_EPS_RECONCILIATION = "EPS RECONCILIATION"
-    ROW_BASIC_PRIMARY_WEIGHTED_AVERAGE_SHARES = "Basic/primary weighted average shares"
-    ROW_BASIC_PRIMARY_EPS_EXCL_EXTRA_ITEMS = "Basic/primary eps excl. extra items"
-    ROW_BASIC_PRIMARY_EPS_INCL_EXTRA_ITEMS = "Basic/primary eps incl. extra items"
-    ROW_DILUTION_ADJUSTMENT = "Dilution adjustment"
-    ROW_DILUTED_WEIGHTED_AVERAGE_SHARES = "Diluted weighted average shares"
-    ROW_DILUTED_EPS_EXCL_EXTRA_ITEMS = "Diluted eps excl. extra items"
-    ROW_DILUTED_EPS_INCL_EXTRA_ITEMS = "Diluted eps incl. extra items"
-    ROW_DPS__COMMON_STOCK_PRIMARY_ISSUE = "DPS - common stock primary issue"
-    ROW_GROSS_DIVIDEND__COMMON_STOCK = "Gross dividend - common stock"
-    ROW_PRO_FORMA_NET_INCOME = "Pro forma net income"
-    ROW_INTEREST_EXPENSE_SUPPLEMENTAL = "Interest expense, supplemental"
-    ROW_DEPRECIATION_SUPPLEMENTAL = "Depreciation, supplemental"
-    ROW_TOTAL_SPECIAL_ITEMS = "Total special items"
-    ROW_NORMALIZED_INCOME_BEFORE_TAXES = "Normalized income before taxes"
-    ROW_EFFECT_OF_SPECIAL_ITEMS_ON_INCOME_TAXES = "Effect of special items on income taxes"
-    ROW_INCOME_TAX_EXCLUDING_IMPACT_OF_SPECIAL_ITEMS = "Income tax excluding impact of special items"
-    ROW_NORMALIZED_INCOME_AFTER_TAX = "Normalized income after tax"
-    ROW_NORMALIZED_INCOME_AVAIL_TO_COMMON = "Normalized income avail. to common"
-    ROW_BASIC_NORMALIZED_EPS = "Basic normalized EPS"
-    ROW_DILUTED_NORMALIZED_EPS = "Diluted normalized EPS"
+    ROW_TOTAL_REVENUE = sys.intern("Total revenue")
+    ROW_COST_OF_REVENUE_TOTAL = sys.intern("Cost of revenue total")
+    ROW_SELLING_GENERAL_AND_ADMIN_EXPENSES_TOTAL = sys.intern("Selling, general and admin. expenses, total")
+    ROW_DEPRECIATION_AMORTIZATION = sys.intern("Depreciation/amortization")
+    ROW_UNUSUAL_EXPENSE_INCOME_ = sys.intern("Unusual expense(income)")
+    ROW_OTHER_OPERATING_EXPENSES_TOTAL = sys.intern("Other operating expenses, total")
+    ROW_TOTAL_OPERATING_EXPENSE = sys.intern("Total operating expense")
+    ROW_OPERATING_INCOME = sys.intern("Operating income")
+    ROW_OTHER_NET = sys.intern("Other, net")
+    ROW_NET_INCOME_BEFORE_TAXES = sys.intern("Net income before taxes")
+    ROW_PROVISION_FOR_INCOME_TAXES = sys.intern("Provision for income taxes")
+    ROW_NET_INCOME_AFTER_TAXES = sys.intern("Net income after taxes")
+    ROW_MINORITY_INTEREST = sys.intern("Minority interest")
+    ROW_NET_INCOME_BEFORE_EXTRA_ITEMS = sys.intern("Net income before extra. Items")
+    ROW_TOTAL_EXTRAORDINARY_ITEMS = sys.intern("Total extraordinary items")
+    ROW_NET_INCOME = sys.intern("Net income")
+    ROW_INCAVAIL_TO_COMMON_EXCL_EXTRA_ITEMS = sys.intern("Inc.avail. to common excl. extra. Items")
+    ROW_INCAVAIL_TO_COMMON_INCL_EXTRA_ITEMS = sys.intern("Inc.avail. to common incl. extra. Items")
+    ROW_EPS_RECONCILIATION = sys.intern("EPS RECONCILIATION")
+    ROW_BASIC_PRIMARY_WEIGHTED_AVERAGE_SHARES = sys.intern("Basic/primary weighted average shares")
+    ROW_BASIC_PRIMARY_EPS_EXCL_EXTRA_ITEMS = sys.intern("Basic/primary eps excl. extra items")
+    ROW_BASIC_PRIMARY_EPS_INCL_EXTRA_ITEMS = sys.intern("Basic/primary eps incl. extra items")
+    ROW_DILUTION_ADJUSTMENT = sys.intern("Dilution adjustment")
+    ROW_DILUTED_WEIGHTED_AVERAGE_SHARES = sys.intern("Diluted weighted average shares")
+    ROW_DILUTED_EPS_EXCL_EXTRA_ITEMS = sys.intern("Diluted eps excl. extra items")
+    ROW_DILUTED_EPS_INCL_EXTRA_ITEMS = sys.intern("Diluted eps incl. extra items")
+    ROW_DPS__COMMON_STOCK_PRIMARY_ISSUE = sys.intern("DPS - common stock primary issue")
+    ROW_GROSS_DIVIDEND__COMMON_STOCK = sys.intern("Gross dividend - common stock")
+    ROW_PRO_FORMA_NET_INCOME = sys.intern("Pro forma net income")
+    ROW_INTEREST_EXPENSE_SUPPLEMENTAL = sys.intern("Interest expense, supplemental")
+    ROW_DEPRECIATION_SUPPLEMENTAL = sys.intern("Depreciation, supplemental")
+    ROW_TOTAL_SPECIAL_ITEMS = sys.intern("Total special items")
+    ROW_NORMALIZED_INCOME_BEFORE_TAXES = sys.intern("Normalized income before taxes")
+    ROW_EFFECT_OF_SPECIAL_ITEMS_ON_INCOME_TAXES = sys.intern("Effect of special items on income taxes")
+    ROW_INCOME_TAX_EXCLUDING_IMPACT_OF_SPECIAL_ITEMS = sys.intern("Income tax excluding impact of special items")
+    ROW_NORMALIZED_INCOME_AFTER_TAX = sys.intern("Normalized income after tax")
+    ROW_NORMALIZED_INCOME_AVAIL_TO_COMMON = sys.intern("Normalized income avail. to common")
+    ROW_BASIC_NORMALIZED_EPS = sys.intern("Basic normalized EPS")
+    ROW_DILUTED_NORMALIZED_EPS = sys.intern("Diluted normalized EPS")
 
 
 class IC_BALANCE_DATA:
@@ -445,38 +876,38 @@ class IC_BALANCE_DATA:
     NEW_BALANCE_LINE_ITEM_COLUMN_NAME = 'Balance Line Item'
 
     # DATA ROWS
-    ROW_CASH_AND_SHORT_TERM_INVESTMENTS = "Cash And Short Term Investments"
-    ROW_TOTAL_RECEIVABLES_NET = "Total Receivables, Net"
-    ROW_TOTAL_INVENTORY = "Total Inventory"
-    ROW_PREPAID_EXPENSES = "Prepaid expenses"
-    ROW_OTHER_CURRENT_ASSETS_TOTAL = "Other current assets, total"
-    ROW_TOTAL_CURRENT_ASSETS = "Total current assets"
-    ROW_PROPERTY_PLANT_AND_EQUIPMENT_NET = "Property, plant & equipment, net"
-    ROW_GOODWILL_NET = "Goodwill, net"
-    ROW_INTANGIBLES_NET = "Intangibles, net"
-    ROW_LONG_TERM_INVESTMENTS = "Long term investments"
-    ROW_NOTE_RECEIVABLE__LONG_TERM = "Note receivable - long term"
-    ROW_OTHER_LONG_TERM_ASSETS = "Other long term assets"
-    ROW_TOTAL_ASSETS = "Total assets"
-    ROW_ACCOUNTS_PAYABLE = "Accounts payable"
-    ROW_ACCRUED_EXPENSES = "Accrued expenses"
-    ROW_NOTES_PAYABLE_SHORTTERM_DEBT = "Notes payable/short-term debt"
-    ROW_CURRENT_PORTION_LONGTERM_DEBT_CAPITAL_LEASES = "Current portion long-term debt/capital leases"
-    ROW_OTHER_CURRENT_LIABILITIES_TOTAL = "Other current liabilities, total"
-    ROW_TOTAL_CURRENT_LIABILITIES = "Total current liabilities"
-    ROW_TOTAL_LONG_TERM_DEBT = "Total long term debt"
-    ROW_TOTAL_DEBT = "Total debt"
-    ROW_DEFERRED_INCOME_TAX = "Deferred income tax"
-    ROW_MINORITY_INTEREST = "Minority interest"
-    ROW_OTHER_LIABILITIES_TOTAL = "Other liabilities, total"
-    ROW_TOTAL_LIABILITIES = "Total liabilities"
-    ROW_COMMON_STOCK = "Common stock"
-    ROW_ADDITIONAL_PAIDIN_CAPITAL = "Additional paid-in capital"
-    ROW_RETAINED_EARNINGS__ACCUMULATED_DEFICIT_ = "Retained earnings (accumulated deficit)"
-    ROW_TREASURY_STOCK__COMMON = "Treasury stock - common"
-    ROW_UNREALIZED_GAIN__LOSS_ = "Unrealized gain (loss)"
-    ROW_OTHER_EQUITY_TOTAL = "Other equity, total"
-    ROW_TOTAL_EQUITY = "Total equity"
-    ROW_TOTAL_LIABILITIES_AND_SHAREHOLDERS_EQUITY = "Total liabilities & shareholders' equity"
-    ROW_TOTAL_COMMON_SHARES_OUTSTANDING = "Total common shares outstanding"
-    ROW_TREASURY_SHARES__COMMON_PRIMARY_ISSUE = "Treasury shares - common primary issue"
+    ROW_CASH_AND_SHORT_TERM_INVESTMENTS = sys.intern("Cash And Short Term Investments")
+    ROW_TOTAL_RECEIVABLES_NET = sys.intern("Total Receivables, Net")
+    ROW_TOTAL_INVENTORY = sys.intern("Total Inventory")
+    ROW_PREPAID_EXPENSES = sys.intern("Prepaid expenses")
+    ROW_OTHER_CURRENT_ASSETS_TOTAL = sys.intern("Other current assets, total")
+    ROW_TOTAL_CURRENT_ASSETS = sys.intern("Total current assets")
+    ROW_PROPERTY_PLANT_AND_EQUIPMENT_NET = sys.intern("Property, plant & equipment, net")
+    ROW_GOODWILL_NET = sys.intern("Goodwill, net")
+    ROW_INTANGIBLES_NET = sys.intern("Intangibles, net")
+    ROW_LONG_TERM_INVESTMENTS = sys.intern("Long term investments")
+    ROW_NOTE_RECEIVABLE__LONG_TERM = sys.intern("Note receivable - long term")
+    ROW_OTHER_LONG_TERM_ASSETS = sys.intern("Other long term assets")
+    ROW_TOTAL_ASSETS = sys.intern("Total assets")
+    ROW_ACCOUNTS_PAYABLE = sys.intern("Accounts payable")
+    ROW_ACCRUED_EXPENSES = sys.intern("Accrued expenses")
+    ROW_NOTES_PAYABLE_SHORTTERM_DEBT = sys.intern("Notes payable/short-term debt")
+    ROW_CURRENT_PORTION_LONGTERM_DEBT_CAPITAL_LEASES = sys.intern("Current portion long-term debt/capital leases")
+    ROW_OTHER_CURRENT_LIABILITIES_TOTAL = sys.intern("Other current liabilities, total")
+    ROW_TOTAL_CURRENT_LIABILITIES = sys.intern("Total current liabilities")
+    ROW_TOTAL_LONG_TERM_DEBT = sys.intern("Total long term debt")
+    ROW_TOTAL_DEBT = sys.intern("Total debt")
+    ROW_DEFERRED_INCOME_TAX = sys.intern("Deferred income tax")
+    ROW_MINORITY_INTEREST = sys.intern("Minority interest")
+    ROW_OTHER_LIABILITIES_TOTAL = sys.intern("Other liabilities, total")
+    ROW_TOTAL_LIABILITIES = sys.intern("Total liabilities")
+    ROW_COMMON_STOCK = sys.intern("Common stock")
+    ROW_ADDITIONAL_PAIDIN_CAPITAL = sys.intern("Additional paid-in capital")
+    ROW_RETAINED_EARNINGS__ACCUMULATED_DEFICIT_ = sys.intern("Retained earnings (accumulated deficit)")
+    ROW_TREASURY_STOCK__COMMON = sys.intern("Treasury stock - common")
+    ROW_UNREALIZED_GAIN__LOSS_ = sys.intern("Unrealized gain (loss)")
+    ROW_OTHER_EQUITY_TOTAL = sys.intern("Other equity, total")
+    ROW_TOTAL_EQUITY = sys.intern("Total equity")
+    ROW_TOTAL_LIABILITIES_AND_SHAREHOLDERS_EQUITY = sys.intern("Total liabilities & shareholders' equity")
+    ROW_TOTAL_COMMON_SHARES_OUTSTANDING = sys.intern("Total common shares outstanding")
+    ROW_TREASURY_SHARES__COMMON_PRIMARY_ISSUE = sys.intern("Treasury shares - common primary issue")
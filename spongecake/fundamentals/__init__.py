@@ -1,2 +1,25 @@
-from spongecake.fundamentals.InvestorsChronicleInterface import InvestorsChronicleInterface, IC_SUMMARY_DATA, IC_INCOME_DATA, IC_BALANCE_DATA
+import importlib
+import sys
+import types
 
+# Imported on first use, so importing FinancialWebsiteInterface alone doesn't pay for pandas via InvestorsChronicleInterface
+__all__ = ['InvestorsChronicleInterface', 'IC_SUMMARY_DATA', 'IC_INCOME_DATA', 'IC_BALANCE_DATA']
+
+
+def __getattr__(name):
+    if name not in __all__:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('spongecake.fundamentals.InvestorsChronicleInterface'), name)
+    globals()[name] = value
+    return value
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Once imported, the submodule is bound here under its own name, which would hide the class exported as that name
+        if name == 'InvestorsChronicleInterface' and isinstance(value, types.ModuleType):
+            value = value.InvestorsChronicleInterface
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -1,13 +1,26 @@
 import pandas as pd
 
+# Before pandas 3 (where copy-on-write makes every rename copy-free), rename() copies the data unless told not to
+_RENAME_KWARGS = {'copy': False} if int(pd.__version__.split('.')[0]) < 3 else {}
+
 class PricesInterface:
 
+    # Deprecated: kept for existing callers, use _rename_columns() with every rename in one mapping instead
     @staticmethod
     def _rename_column(df_prices, old_name, new_name):
-        return df_prices.rename(columns={old_name : new_name})
+        return PricesInterface._rename_columns(df_prices, {old_name : new_name})
+
+    @staticmethod
+    def _rename_columns(df_prices, column_names):
+        # Only the column labels change, so the price data is shared with df_prices rather than copied
+        return df_prices.rename(columns=column_names, **_RENAME_KWARGS)
 
     @staticmethod
     def _remove_duplicate_rows_from_dataframe(df: pd.DataFrame()):
+        # Duplicates are rare, and has_duplicates is cached on the index, so don't build a mask and a copy when there are none
+        if not df.index.has_duplicates:
+            return df
+
         no_dups = df[~df.index.duplicated(keep='first')]
         dup_diff = len(df) - len(no_dups)
         if dup_diff > 0:
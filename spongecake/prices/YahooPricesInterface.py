@@ -1,44 +1,330 @@
 import logging
-import pandas_datareader as pdr
+import itertools
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+import yfinance as yf
+import numpy as np
 import pandas as pd
 from spongecake.prices.PricesInterface import PricesInterface, PRICES_COLS
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, timedelta
 
 
 class YahooPricesInterface(PricesInterface):
 
-    prices_cache = {}
+    # Yahoo serves up to this many symbols from one request
+    MAX_TIDMS_PER_DOWNLOAD = 20
 
-    def get_yahoo_prices(self, tidm, market='L', from_date=(date.today() - timedelta(days=365)), to_date=date.today(), force_cache_refresh=False):
-        if tidm in self.prices_cache.keys() and force_cache_refresh is False:
-            logging.info('Found {0} in Yahoo Historic Prices cache returning that instead'.format(tidm))
-            return self.prices_cache[tidm]
+    # Downloads that raise (e.g. rate limited) are tried this many times in all, backing off exponentially (with jitter)
+    # up to a minute between attempts so a rate-limited batch doesn't keep hammering Yahoo
+    max_download_retries = 4
+    max_download_backoff = 60
 
-        from_date_str = from_date.strftime('%Y-%m-%d')
-        to_date_str = to_date.strftime('%Y-%m-%d')
-        logging.info('Attempting to download historic prices for [{0}] between dates [{1}] and [{2}] from YAHOO'.format(tidm, from_date_str, to_date_str))
-        try:
-            df_prices = pdr.DataReader('{0}.{1}'.format(tidm,market), 'yahoo', from_date_str, to_date_str)
-            logging.info('Downloaded [{0}] prices for [{1}.{2}]'.format(len(df_prices), tidm, market))
-        except:
-            logging.error('Unable to download prices for [{0}.{1}], you\'ll have to do this manually'.format(tidm, market))
-            return pd.DataFrame()
-        df_prices = self._remove_duplicate_rows_from_dataframe(df_prices)
-
-        # To sanitise everything (in case we're using multiple price interfaces) rename to a set of standard columns names
-        df_prices = self._rename_column(df_prices, YAHOO_DATA_COLUMNS.YHF_CLOSE_COLUMN, PRICES_COLS.COL_CLOSE)
-        df_prices = self._rename_column(df_prices, YAHOO_DATA_COLUMNS.YHF_HIGH_COLUMN, PRICES_COLS.COL_HIGH)
-        df_prices = self._rename_column(df_prices, YAHOO_DATA_COLUMNS.YHF_LOW_COLUMN, PRICES_COLS.COL_LOW)
-        df_prices = self._rename_column(df_prices, YAHOO_DATA_COLUMNS.YHF_OPEN_COLUMN, PRICES_COLS.COL_OPEN)
-        df_prices = self._rename_column(df_prices, YAHOO_DATA_COLUMNS.YHF_ADJ_CLOSE_COLUMN, PRICES_COLS.COL_ADJUSTED_CLOSE)
-
-        self.prices_cache[tidm] = df_prices
+    # Most (tidm, market, from_date, to_date) price histories kept before the least recently used is dropped
+    cache_maxsize = 256
+
+    # If set, downloaded prices are also written here as one parquet file per (tidm, market), so later runs can read them
+    # back instead of downloading them again. Needs pyarrow (the 'parquet' extra).
+    persistent_cache_dir = None
+
+    # What prices are cached (and persisted) as. dtype=np.float32 halves the memory each price history takes, as Yahoo only
+    # quotes to a handful of significant figures, but the Stochastic Oscillator magnifies the rounding when the high/low range
+    # is narrow, so full precision is the default.
+    dtype = np.float64
+
+    def __init__(self, cache_maxsize=None, persistent_cache_dir=None, dtype=None):
+        if cache_maxsize is not None:
+            self.cache_maxsize = cache_maxsize
+        if persistent_cache_dir is not None:
+            self.persistent_cache_dir = persistent_cache_dir
+        if dtype is not None:
+            self.dtype = dtype
+        self.prices_cache = OrderedDict()
+        # (tidm, market) -> [(from_date, to_date, prices)], so a narrower date range can be sliced out of one already downloaded
+        self._range_index = OrderedDict()
+        self.__prices_cache_lock = threading.Lock()
+        self.__inflight = {}
+
+    def _cache_get(self, key):
+        # Callers must hold the prices cache lock
+        df_prices = self.prices_cache.get(key)
+        if df_prices is not None:
+            self.prices_cache.move_to_end(key)
         return df_prices
 
+    def _cache_put(self, key, df_prices):
+        # Callers must hold the prices cache lock
+        self.prices_cache[key] = df_prices
+        self.prices_cache.move_to_end(key)
+        while len(self.prices_cache) > self.cache_maxsize:
+            evicted_key, _ = self.prices_cache.popitem(last=False)
+            logging.info('Yahoo Historic Prices cache is full, dropping least recently used %s', evicted_key)
+
+    def _range_get(self, tidm, market, from_date, to_date):
+        # Callers must hold the prices cache lock
+        for range_from_date, range_to_date, df_prices in self._range_index.get((tidm, market), []):
+            if range_from_date <= from_date and to_date <= range_to_date:
+                self._range_index.move_to_end((tidm, market))
+                # A copy, so columns the caller adds (e.g. indicators) don't end up in the range index
+                return df_prices.loc[pd.Timestamp(from_date):pd.Timestamp(to_date)].copy()
+        return None
+
+    def _range_put(self, tidm, market, from_date, to_date, df_prices):
+        # Callers must hold the prices cache lock. Ranges that overlap or touch the new one are merged into it, preferring
+        # the newly downloaded prices where both have the same date. The range index keeps its own copy of just the prices,
+        # as the frame passed in is also handed back to the caller, who may add columns to it.
+        # Today's bar is still being traded, so ranges only ever cover up to yesterday. Returns None if nothing is left.
+        to_date = min(to_date, date.today() - timedelta(days=1))
+        if to_date < from_date:
+            return None
+        df_prices = df_prices.loc[:pd.Timestamp(to_date), [column for column in df_prices.columns if column in _CACHED_COLUMNS]].copy()
+        ranges = []
+        for range_from_date, range_to_date, df_range_prices in self._range_index.get((tidm, market), []):
+            if range_from_date <= to_date + timedelta(days=1) and from_date <= range_to_date + timedelta(days=1):
+                from_date = min(from_date, range_from_date)
+                to_date = max(to_date, range_to_date)
+                df_prices = self._remove_duplicate_rows_from_dataframe(pd.concat([df_prices, df_range_prices])).sort_index()
+            else:
+                ranges.append((range_from_date, range_to_date, df_range_prices))
+        ranges.append((from_date, to_date, df_prices))
+
+        self._range_index[(tidm, market)] = ranges
+        self._range_index.move_to_end((tidm, market))
+        while len(self._range_index) > self.cache_maxsize:
+            self._range_index.popitem(last=False)
+        return from_date, to_date, df_prices
+
+    def _persisted_prices_path(self, tidm, market):
+        return os.path.join(self.persistent_cache_dir, '{0}.{1}.parquet'.format(tidm, market))
+
+    def _load_persisted_prices(self, tidm, market):
+        # Returns (from_date, to_date, prices) for the range held on disk, or None if there isn't one that can be read
+        path = self._persisted_prices_path(tidm, market)
+        if not os.path.exists(path):
+            return None
+        try:
+            df_prices = pd.read_parquet(path)
+        except (ImportError, OSError, ValueError) as e:
+            logging.error('Unable to read persisted prices %s, downloading them instead: %s', path, e)
+            return None
+        # The range asked for is kept alongside the prices, as weekends and holidays mean the index alone can't tell us.
+        # Without it (e.g. a file written some other way) there's no knowing what the file covers, so treat it as unreadable.
+        try:
+            from_date = date.fromisoformat(df_prices.attrs['from_date'])
+            to_date = date.fromisoformat(df_prices.attrs['to_date'])
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error('Persisted prices %s don\'t record the dates they cover, downloading them instead: %r', path, e)
+            return None
+        df_prices.attrs = {}
+        # The file may have been written by an instance using a different dtype
+        df_prices = self._set_price_dtype(df_prices)
+        return from_date, to_date, df_prices
+
+    def _set_price_dtype(self, df_prices):
+        return df_prices.astype({column: self.dtype for column in _PRICE_COLUMNS}, copy=False)
+
+    def _persist_prices(self, tidm, market, from_date, to_date, df_prices):
+        path = self._persisted_prices_path(tidm, market)
+        # Only the prices themselves, never columns a caller added
+        df_persisted = df_prices[[column for column in df_prices.columns if column in _CACHED_COLUMNS]]
+        df_persisted.attrs = {'from_date': from_date.isoformat(), 'to_date': to_date.isoformat()}
+        try:
+            os.makedirs(self.persistent_cache_dir, exist_ok=True)
+            # Write alongside then swap in, so a reader never sees a half written file
+            df_persisted.to_parquet(path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+        except (ImportError, OSError, ValueError) as e:
+            logging.error('Unable to persist prices to %s: %s', path, e)
+
+    def get_yahoo_prices(self, tidm, market='L', from_date=None, to_date=None, force_cache_refresh=False):
+        prices = self.get_yahoo_prices_many([tidm], market, from_date, to_date, force_cache_refresh)
+        return prices.get(tidm, pd.DataFrame())
+
+    def get_yahoo_prices_many(self, tidms, market='L', from_date=None, to_date=None, force_cache_refresh=False):
+        # Returns a dict of tidm -> prices. Anything not already cached is downloaded in batches of up to
+        # MAX_TIDMS_PER_DOWNLOAD tidms a request, rather than one request per tidm. Tidms that couldn't be downloaded are left out.
+        # Cache hits are found from the raw arguments, and log lazily, so they don't format any dates or strings.
+        # The dates default to the year up to today, worked out on each call rather than frozen when the module was imported
+        today = date.today()
+        if from_date is None:
+            from_date = today - timedelta(days=365)
+        if to_date is None:
+            to_date = today
+        prices = {}
+        tidms_to_download = []
+        tidms_to_wait_for = {}
+        with self.__prices_cache_lock:
+            for tidm in dict.fromkeys(tidms):
+                key = (tidm, market, from_date, to_date)
+                if force_cache_refresh is False and (df_prices := self._cache_get(key)) is not None:
+                    logging.info('Found %s in Yahoo Historic Prices cache returning that instead', tidm)
+                    prices[tidm] = df_prices
+                elif force_cache_refresh is False and (df_prices := self._range_get(tidm, market, from_date, to_date)) is not None:
+                    logging.info('Found %s for a wider date range in Yahoo Historic Prices cache returning part of that instead', tidm)
+                    self._cache_put(key, df_prices)
+                    prices[tidm] = df_prices
+                elif key in self.__inflight:
+                    # Another thread is already downloading this tidm, so use its result rather than download it again
+                    tidms_to_wait_for[tidm] = self.__inflight[key]
+                else:
+                    self.__inflight[key] = Future()
+                    tidms_to_download.append(tidm)
+
+        try:
+            if self.persistent_cache_dir is not None and force_cache_refresh is False:
+                tidms_to_download = self.__get_persisted_prices(tidms_to_download, market, from_date, to_date, prices)
+
+            batches = iter(tidms_to_download)
+            while True:
+                batch = list(itertools.islice(batches, self.MAX_TIDMS_PER_DOWNLOAD))
+                if not batch:
+                    break
+
+                downloaded = self._download_yahoo_prices(batch, market, from_date, to_date)
+                ranges_to_persist = {}
+                with self.__prices_cache_lock:
+                    for tidm in batch:
+                        key = (tidm, market, from_date, to_date)
+                        if tidm in downloaded:
+                            self._cache_put(key, downloaded[tidm])
+                            merged_range = self._range_put(tidm, market, from_date, to_date, downloaded[tidm])
+                            if merged_range is not None:
+                                ranges_to_persist[tidm] = merged_range
+                            prices[tidm] = downloaded[tidm]
+                        self.__inflight.pop(key).set_result(downloaded.get(tidm))
+
+                # Persist the merged range, so the file on disk covers everything downloaded for the tidm so far
+                if self.persistent_cache_dir is not None:
+                    for tidm, (range_from_date, range_to_date, df_range_prices) in ranges_to_persist.items():
+                        self._persist_prices(tidm, market, range_from_date, range_to_date, df_range_prices)
+        finally:
+            # Don't leave other threads waiting forever on tidms this call never got to
+            with self.__prices_cache_lock:
+                for tidm in tidms_to_download:
+                    future = self.__inflight.pop((tidm, market, from_date, to_date), None)
+                    if future is not None:
+                        future.set_result(None)
+
+        for tidm, future in tidms_to_wait_for.items():
+            df_prices = future.result()
+            if df_prices is not None:
+                prices[tidm] = df_prices
+
+        return prices
+
+    def __get_persisted_prices(self, tidms, market, from_date, to_date, prices):
+        # Fills in prices for the tidms whose persisted range covers the dates asked for, and returns the rest
+        tidms_to_download = []
+        for tidm in tidms:
+            persisted = self._load_persisted_prices(tidm, market)
+            if persisted is None or not (persisted[0] <= from_date and to_date <= persisted[1]):
+                tidms_to_download.append(tidm)
+                continue
+
+            key = (tidm, market, from_date, to_date)
+            with self.__prices_cache_lock:
+                self._range_put(tidm, market, *persisted)
+                # None if the file claimed to cover today, which the range index won't
+                df_prices = self._range_get(tidm, market, from_date, to_date)
+                if df_prices is not None:
+                    self._cache_put(key, df_prices)
+                    prices[tidm] = df_prices
+                    self.__inflight.pop(key).set_result(df_prices)
+            if df_prices is None:
+                tidms_to_download.append(tidm)
+                continue
+            logging.info('Found %s in persisted Yahoo Historic Prices returning that instead', tidm)
+        return tidms_to_download
+
+    def get_yahoo_prices_parallel(self, tidms, max_workers=8, **kwargs):
+        # For callers that want one request per tidm (e.g. different dates per tidm), overlap the downloads on a thread pool
+        tidms = list(dict.fromkeys(tidms))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda tidm: self.get_yahoo_prices(tidm, **kwargs), tidms)
+            return dict(zip(tidms, results))
+
+    def __download_with_retries(self, symbols, from_date_str, to_date_str):
+        # Returns {symbol: prices} for the symbols Yahoo supplied. Only a download that raised is retried; a symbol with no
+        # prices (a weekend range, a delisted or mistyped tidm) is an answer, so it isn't asked for again.
+        for attempt in range(1, self.max_download_retries + 1):
+            try:
+                df_batch = yf.download(tickers=' '.join(symbols), start=from_date_str, end=to_date_str, group_by='ticker',
+                                       auto_adjust=False, threads=True, progress=False)
+            # OSError covers the network errors from both requests and curl_cffi, whichever yfinance is using
+            except (yf.exceptions.YFException, OSError, ValueError, KeyError) as e:
+                if attempt == self.max_download_retries:
+                    logging.error('Attempt %s of %s to download %s failed, giving up: %r', attempt, self.max_download_retries, symbols, e)
+                    return {}
+                backoff = min(self.max_download_backoff, 2 ** attempt + random.random())
+                logging.warning('Attempt %s of %s to download %s failed, retrying in %.1fs: %r', attempt, self.max_download_retries, symbols, backoff, e)
+                time.sleep(backoff)
+                continue
+
+            downloaded = {}
+            for symbol in symbols:
+                df_prices = self.__get_symbol_prices(df_batch, symbol)
+                if df_prices is not None:
+                    downloaded[symbol] = df_prices
+            return downloaded
+        return {}
+
+    @staticmethod
+    def __get_symbol_prices(df_batch, symbol):
+        # Columns are (symbol, field) pairs; tickers Yahoo couldn't supply are missing or come back as all-NaN columns
+        if not isinstance(df_batch.columns, pd.MultiIndex) or symbol not in df_batch.columns.get_level_values(0):
+            return None
+        df_prices = df_batch.xs(symbol, level=0, axis=1).dropna(how='all')
+        return df_prices if len(df_prices) > 0 else None
+
+    def _download_yahoo_prices(self, tidms, market, from_date, to_date):
+        from_date_str = from_date.strftime('%Y-%m-%d')
+        # Yahoo's end date is exclusive, so ask for the day after to include to_date
+        to_date_str = (to_date + timedelta(days=1)).strftime('%Y-%m-%d')
+        # yfinance upper cases the tickers it labels its columns with, so ask for (and look up) the symbols that way too;
+        # the results stay keyed on the tidm as the caller gave it
+        symbols = {tidm: '{0}.{1}'.format(tidm, market).upper() for tidm in tidms}
+        logging.info('Attempting to download historic prices for %s between dates [%s] and [%s] from YAHOO', tidms, from_date, to_date)
+        downloaded = self.__download_with_retries(list(dict.fromkeys(symbols.values())), from_date_str, to_date_str)
+
+        prices = {}
+        for tidm, symbol in symbols.items():
+            df_prices = downloaded.get(symbol)
+            if df_prices is None:
+                logging.error('Unable to download prices for [%s], you\'ll have to do this manually', symbol)
+                continue
+            logging.info('Downloaded [%s] prices for [%s]', len(df_prices), symbol)
+
+            df_prices = self._remove_duplicate_rows_from_dataframe(df_prices)
+
+            # To sanitise everything (in case we're using multiple price interfaces) rename to a set of standard columns names
+            df_prices = self._rename_columns(df_prices, _YAHOO_TO_STD)
+            df_prices = self._set_price_dtype(df_prices)
+            prices[tidm] = df_prices
+
+        return prices
+
 
 class YAHOO_DATA_COLUMNS:
     YHF_CLOSE_COLUMN = 'Close'
     YHF_HIGH_COLUMN = 'High'
     YHF_LOW_COLUMN = 'Low'
     YHF_OPEN_COLUMN = 'Open'
-    YHF_ADJ_CLOSE_COLUMN  = 'Adj Close'
\ No newline at end of file
+    YHF_ADJ_CLOSE_COLUMN  = 'Adj Close'
+    YHF_VOLUME_COLUMN = 'Volume'
+
+
+# Yahoo column -> standard column, built once rather than on every download
+_YAHOO_TO_STD = {YAHOO_DATA_COLUMNS.YHF_CLOSE_COLUMN: PRICES_COLS.COL_CLOSE,
+                 YAHOO_DATA_COLUMNS.YHF_HIGH_COLUMN: PRICES_COLS.COL_HIGH,
+                 YAHOO_DATA_COLUMNS.YHF_LOW_COLUMN: PRICES_COLS.COL_LOW,
+                 YAHOO_DATA_COLUMNS.YHF_OPEN_COLUMN: PRICES_COLS.COL_OPEN,
+                 YAHOO_DATA_COLUMNS.YHF_ADJ_CLOSE_COLUMN: PRICES_COLS.COL_ADJUSTED_CLOSE}
+
+# The columns cast to the dtype the instance caches prices as (volume is left alone)
+_PRICE_COLUMNS = [PRICES_COLS.COL_OPEN, PRICES_COLS.COL_HIGH, PRICES_COLS.COL_LOW, PRICES_COLS.COL_CLOSE, PRICES_COLS.COL_ADJUSTED_CLOSE]
+
+# The columns kept in the range index and persisted; anything callers add to the frames they're given is left out
+_CACHED_COLUMNS = frozenset(_PRICE_COLUMNS + [YAHOO_DATA_COLUMNS.YHF_VOLUME_COLUMN])
@@ -1,31 +1,121 @@
 from spongecake.prices.PricesInterface import PRICES_COLS
+from spongecake.technicals import _kernels
 import logging
+import numpy as np
 import pandas as pd
 
 
+def _require_nonempty(df_prices, indicator_name):
+    if len(df_prices) <= 0:
+        logging.error('error: you need a set of prices in the \'price_data\' field of the company before you can calculate the {0}.'.format(indicator_name))
+        return False
+    return True
+
+
+def _is_window_count(periods):
+    # A plain number of rows, as opposed to a time window like '14D' that needs a DatetimeIndex to mean anything
+    return isinstance(periods, (int, np.integer)) and periods > 0
+
+
 class Indicators:
 
+    @staticmethod
+    def compute_stochastic(close, high, low, slow_periods=14, fast_periods=3):
+        # ndarrays in, (%K, %D) ndarrays out, for callers (e.g. backtests over many tidms) that already have the prices as
+        # arrays and don't want to build a DataFrame just to get the indicators back out of it
+        closes = np.asarray(close, dtype=np.float64)
+        highs = np.asarray(high, dtype=np.float64)
+        lows = np.asarray(low, dtype=np.float64)
+        if _kernels.HAVE_NUMBA and _is_window_count(slow_periods):
+            low_roll_min = _kernels.rolling_min(lows, slow_periods)
+            high_roll_max = _kernels.rolling_max(highs, slow_periods)
+        else:
+            low_roll_min = pd.Series(lows).rolling(slow_periods).min().to_numpy()
+            high_roll_max = pd.Series(highs).rolling(slow_periods).max().to_numpy()
+        # A flat window (high == low) gives inf/NaN, as it does when pandas does the division
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stochastic_k = ((closes - low_roll_min) / (high_roll_max - low_roll_min)) * 100
+        stochastic_d = pd.Series(stochastic_k).rolling(fast_periods).mean().to_numpy()
+        return stochastic_k, stochastic_d
+
+    @staticmethod
+    def compute_macd(close, long_period=26, short_period=3, signal_period=9):
+        # ndarray of closes in, (MACD, signal line) ndarrays out
+        closes = np.asarray(close, dtype=np.float64)
+        if _kernels.HAVE_NUMBA and all(_is_window_count(periods) for periods in (long_period, short_period, signal_period)):
+            # Both EWMAs, the MACD and its signal line in one compiled pass over the closes, with no intermediate Series
+            return _kernels.macd(closes, short_period, long_period, signal_period)
+        closes = pd.Series(closes)
+        macd = closes.ewm(span=short_period, adjust=False, min_periods=short_period).mean() - \
+               closes.ewm(span=long_period, adjust=False, min_periods=long_period).mean()
+        macd_signal = macd.ewm(span=signal_period, adjust=False, min_periods=signal_period).mean()
+        return macd.to_numpy(), macd_signal.to_numpy()
+
+    # ==========================================================================================================================================================================================
+
     @staticmethod
     def set_stochastic_oscillator(df_prices, slow_periods=14, fast_periods=3):
-        if len(df_prices) <= 0:
-            logging.error('error: you need a set of prices in the \'price_data\' field of the company before you can calculate the Stochastic Oscillator.')
-            return pd.DataFrame()
-        df_prices[INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN] = ((df_prices[PRICES_COLS.COL_CLOSE] - df_prices[PRICES_COLS.COL_LOW].rolling(slow_periods).min()) /
-                                                                              (df_prices[PRICES_COLS.COL_HIGH].rolling(slow_periods).max() - df_prices[PRICES_COLS.COL_LOW].rolling(slow_periods).min())) * 100
-        df_prices[INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_D_COLUMN] = df_prices[INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN].rolling(fast_periods).mean()
+        # Nothing to calculate, and df_prices is already an empty frame so hand it back rather than build another
+        if not _require_nonempty(df_prices, 'Stochastic Oscillator'):
+            return df_prices
+        close, high, low = PRICES_COLS.COL_CLOSE, PRICES_COLS.COL_HIGH, PRICES_COLS.COL_LOW
+        k_col = INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN
+        d_col = INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_D_COLUMN
+
+        # The results are plain ndarrays in df_prices' row order, so assigning them back skips pandas' index alignment
+        if _is_window_count(slow_periods) and _is_window_count(fast_periods):
+            stochastic_k, stochastic_d = Indicators.compute_stochastic(df_prices[close].to_numpy(), df_prices[high].to_numpy(),
+                                                                       df_prices[low].to_numpy(), slow_periods, fast_periods)
+        else:
+            # Time windows (e.g. '14D') need the frame's DatetimeIndex, so roll over its columns. Each rolling window is
+            # still only worked out once.
+            low_roll_min = df_prices[low].rolling(slow_periods).min()
+            high_roll_max = df_prices[high].rolling(slow_periods).max()
+            stochastic_k = ((df_prices[close] - low_roll_min) / (high_roll_max - low_roll_min)) * 100
+            stochastic_d = stochastic_k.rolling(fast_periods).mean().to_numpy()
+            stochastic_k = stochastic_k.to_numpy()
+        df_prices[k_col] = stochastic_k
+        df_prices[d_col] = stochastic_d
         return df_prices
 
+    @staticmethod
+    def set_stochastic_oscillator_batch(prices, slow_periods=14, fast_periods=3):
+        # prices is a dict of tidm -> prices, as from YahooPricesInterface.get_yahoo_prices_many(). Each frame gets the
+        # same columns set_stochastic_oscillator would give it, but %K for all of them is worked out in one parallel pass.
+        frames = [df_prices for df_prices in prices.values() if len(df_prices) > 0]
+        if not frames or not (_kernels.HAVE_NUMBA and _is_window_count(slow_periods) and _is_window_count(fast_periods)):
+            for df_prices in frames:
+                Indicators.set_stochastic_oscillator(df_prices, slow_periods, fast_periods)
+            return prices
+
+        # Stack the tidms side by side, lined up on their last rows. Shorter histories are padded with leading NaNs, which
+        # only ever fall in windows that would have been incomplete (so NaN) anyway.
+        n_rows = max(len(df_prices) for df_prices in frames)
+        stacked = {}
+        for col in (PRICES_COLS.COL_CLOSE, PRICES_COLS.COL_HIGH, PRICES_COLS.COL_LOW):
+            stacked[col] = np.full((n_rows, len(frames)), np.nan, order='F')
+            for j, df_prices in enumerate(frames):
+                stacked[col][n_rows - len(df_prices):, j] = df_prices[col].to_numpy()
+
+        stochastic_k = _kernels.stochastic_k_batch(stacked[PRICES_COLS.COL_CLOSE], stacked[PRICES_COLS.COL_HIGH],
+                                                   stacked[PRICES_COLS.COL_LOW], slow_periods)
+        stochastic_d = pd.DataFrame(stochastic_k).rolling(fast_periods).mean().to_numpy()
+        for j, df_prices in enumerate(frames):
+            df_prices[INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN] = stochastic_k[n_rows - len(df_prices):, j]
+            df_prices[INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_D_COLUMN] = stochastic_d[n_rows - len(df_prices):, j]
+        return prices
+
     @staticmethod
     def set_macd(df_prices, long_period=26, short_period=3, signal_period=9):
-        if len(df_prices) <= 0:
-            logging.error('error: you need a set of prices in the \'price_data\' field of the company before you can calculate the Stochastic Oscillator.')
-            return
-        df_prices[INDICATOR_COLS.COL_MACD_COLUMN] = \
-            (df_prices[PRICES_COLS.COL_CLOSE]).ewm(span=short_period, adjust=False, min_periods=short_period).mean() - \
-            (df_prices[PRICES_COLS.COL_CLOSE]).ewm(span=long_period, adjust=False, min_periods=long_period).mean()
-        df_prices[INDICATOR_COLS.COL_MACD_SIGNAL_COLUMN] = df_prices[INDICATOR_COLS.COL_MACD_COLUMN].ewm(span=signal_period, adjust=False, min_periods=signal_period).mean()
-        return df_prices
+        if not _require_nonempty(df_prices, 'MACD'):
+            return df_prices
+        close = PRICES_COLS.COL_CLOSE
+        macd_col, signal_col = INDICATOR_COLS.COL_MACD_COLUMN, INDICATOR_COLS.COL_MACD_SIGNAL_COLUMN
 
+        macd, macd_signal = Indicators.compute_macd(df_prices[close].to_numpy(), long_period, short_period, signal_period)
+        df_prices[macd_col] = macd
+        df_prices[signal_col] = macd_signal
+        return df_prices
 
 class INDICATOR_COLS:
 
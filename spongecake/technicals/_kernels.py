@@ -0,0 +1,155 @@
+import numpy as np
+
+try:
+    # numba is optional, but runs the rolling windows in one compiled pass when it is installed
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+HAVE_NUMBA = njit is not None
+
+
+# =====================================================================================================================
+# Rolling min/max over a fixed window, matching pandas' rolling(window).min()/.max(): NaN until there is a full window,
+# and NaN for any window containing a NaN. Each keeps a deque of indices whose values only increase (min) or decrease
+# (max) from head to tail, so every value is pushed and popped at most once - O(n) whatever the window size.
+# fastmath isn't used as it assumes there are no NaNs, and prices do have gaps.
+# =====================================================================================================================
+
+def _rolling_min(values, window):
+    n = len(values)
+    result = np.empty(n, dtype=np.float64)
+    deque = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    nans_in_window = 0
+    for i in range(n):
+        value = values[i]
+        if np.isnan(value):
+            nans_in_window += 1
+        else:
+            while tail > head and values[deque[tail - 1]] >= value:
+                tail -= 1
+            deque[tail] = i
+            tail += 1
+
+        if i >= window and np.isnan(values[i - window]):
+            nans_in_window -= 1
+        while tail > head and deque[head] <= i - window:
+            head += 1
+
+        if i < window - 1 or nans_in_window > 0:
+            result[i] = np.nan
+        else:
+            result[i] = values[deque[head]]
+    return result
+
+
+def _rolling_max(values, window):
+    n = len(values)
+    result = np.empty(n, dtype=np.float64)
+    deque = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    nans_in_window = 0
+    for i in range(n):
+        value = values[i]
+        if np.isnan(value):
+            nans_in_window += 1
+        else:
+            while tail > head and values[deque[tail - 1]] <= value:
+                tail -= 1
+            deque[tail] = i
+            tail += 1
+
+        if i >= window and np.isnan(values[i - window]):
+            nans_in_window -= 1
+        while tail > head and deque[head] <= i - window:
+            head += 1
+
+        if i < window - 1 or nans_in_window > 0:
+            result[i] = np.nan
+        else:
+            result[i] = values[deque[head]]
+    return result
+
+
+# =====================================================================================================================
+# MACD in one pass: the short and long EWMAs of the close, their difference, and the signal EWMA of that difference
+# are all carried forward together. Each EWMA step follows pandas' ewm(span, adjust=False, min_periods=span).mean()
+# exactly (including how it decays the weights across gaps), so the results match the pandas path to the last bit.
+# =====================================================================================================================
+
+def _ewm_step(weighted, old_wt, value, alpha):
+    if weighted == weighted:
+        old_wt *= 1. - alpha
+        if value == value:
+            if weighted != value:
+                weighted = (old_wt * weighted + alpha * value) / (old_wt + alpha)
+            old_wt = 1.
+    elif value == value:
+        weighted = value
+    return weighted, old_wt
+
+
+def _macd(close, short_span, long_span, signal_span):
+    n = len(close)
+    macd = np.empty(n, dtype=np.float64)
+    signal = np.empty(n, dtype=np.float64)
+    # Same smoothing factors pandas uses, worked out via the centre of mass
+    short_alpha = 1. / (1. + (short_span - 1) / 2)
+    long_alpha = 1. / (1. + (long_span - 1) / 2)
+    signal_alpha = 1. / (1. + (signal_span - 1) / 2)
+    short_weighted, short_wt = np.nan, 1.
+    long_weighted, long_wt = np.nan, 1.
+    signal_weighted, signal_wt = np.nan, 1.
+    close_obs = 0
+    macd_obs = 0
+    for i in range(n):
+        value = close[i]
+        close_obs += value == value
+        short_weighted, short_wt = _ewm_step(short_weighted, short_wt, value, short_alpha)
+        long_weighted, long_wt = _ewm_step(long_weighted, long_wt, value, long_alpha)
+
+        if close_obs >= max(short_span, 1) and close_obs >= max(long_span, 1):
+            macd[i] = short_weighted - long_weighted
+        else:
+            macd[i] = np.nan
+
+        value = macd[i]
+        macd_obs += value == value
+        signal_weighted, signal_wt = _ewm_step(signal_weighted, signal_wt, value, signal_alpha)
+        signal[i] = signal_weighted if macd_obs >= max(signal_span, 1) else np.nan
+    return macd, signal
+
+
+# =====================================================================================================================
+# Stochastic %K for many tidms at once. Each column of the (rows, tidms) matrices is one tidm's prices; columns are
+# independent so they're spread over all cores, and are contiguous when the matrices are in Fortran order.
+# The numpy error model gives inf/NaN for a flat window (high == low) rather than raising, as numpy itself does.
+# =====================================================================================================================
+
+def _stochastic_k_batch(closes, highs, lows, window):
+    n_rows, n_cols = closes.shape
+    # Filled a tidm per row then handed back transposed, so each tidm's results are contiguous as well (Fortran order)
+    result = np.empty((n_cols, n_rows), dtype=np.float64)
+    for j in prange(n_cols):
+        low_roll_min = rolling_min(lows[:, j], window)
+        high_roll_max = rolling_max(highs[:, j], window)
+        for i in range(n_rows):
+            result[j, i] = ((closes[i, j] - low_roll_min[i]) / (high_roll_max[i] - low_roll_min[i])) * 100
+    return result.T
+
+
+if HAVE_NUMBA:
+    rolling_min = njit(cache=True)(_rolling_min)
+    rolling_max = njit(cache=True)(_rolling_max)
+    _ewm_step = njit(cache=True)(_ewm_step)
+    macd = njit(cache=True)(_macd)
+    stochastic_k_batch = njit(parallel=True, error_model='numpy', cache=True)(_stochastic_k_batch)
+else:
+    rolling_min = None
+    rolling_max = None
+    macd = None
+    stochastic_k_batch = None
@@ -0,0 +1,133 @@
+import io
+import subprocess
+import sys
+
+import pytest
+
+from spongecake.fundamentals import FinancialWebsiteInterface as fwi
+
+TABLE = '<table><tr><th>Name</th></tr><tr><td>café £5</td></tr></table>'
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200, content=b'', headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.text = content.decode('latin-1')
+        self.raw = io.BytesIO(content)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeSession:
+    # Stands in for the shared requests session: each url is served the response registered for it, and the request
+    # headers sent for each url are kept
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+
+    def get(self, url, stream=False, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        response = self.responses[url]
+        return response(headers or {}) if callable(response) else response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(fwi, '_get_session', lambda: session)
+    monkeypatch.setattr(fwi, '_CONDITIONAL_GET_CACHE', fwi.OrderedDict())
+    return session
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('text/html; charset=utf-8', TABLE.encode('utf-8')),
+    ('text/html; charset="ISO-8859-1"', TABLE.encode('latin-1')),
+    ('text/html', '<html><head><meta charset="iso-8859-1"></head><body>{0}</body></html>'.format(TABLE).encode('latin-1')),
+    ('text/html', '<?xml version="1.0" encoding="utf-8"?><html><body>{0}</body></html>'.format(TABLE).encode('utf-8')),
+    ('text/html', TABLE.encode('utf-8')),
+    ('text/html; charset=x-unknown', TABLE.encode('utf-8')),
+])
+def test_download_web_page_decodes_with_declared_charset(session, content_type, body):
+    session.responses['http://site/page'] = FakeResponse('http://site/page', content=body, headers={'Content-Type': content_type})
+    page = fwi.download_web_page('http://site/page')
+
+    assert isinstance(page, str)
+    assert 'café £5' in page
+    # The page's own encoding declaration mustn't stop it being parsed as text
+    assert fwi.get_dataframes_from_html(page)[0].iloc[0, 0] == 'café £5'
+
+
+def test_download_web_page_failure_is_empty_text(session):
+    session.responses['http://site/missing'] = FakeResponse('http://site/missing', status_code=404)
+    assert fwi.download_web_page('http://site/missing') == ''
+
+
+@pytest.mark.parametrize('have_selectolax', [True, False])
+def test_extract_tables_honours_meta_charset_in_bytes(monkeypatch, have_selectolax):
+    if have_selectolax:
+        pytest.importorskip('selectolax')
+    else:
+        monkeypatch.setattr(fwi, 'LexborHTMLParser', None)
+    page = '<html><head><meta charset="iso-8859-1"></head><body>{0}</body></html>'.format(TABLE)
+
+    for data in (page, page.encode('latin-1')):
+        tables = fwi.extract_tables_from_raw_html(data)
+        assert len(tables) == 1 and 'café £5' in tables[0]
+
+
+def test_download_helpers_import_without_pandas():
+    # A fresh interpreter, as this one has already imported pandas
+    code = ('import sys\n'
+            'from spongecake.fundamentals.FinancialWebsiteInterface import download_web_page\n'
+            'assert "pandas" not in sys.modules\n'
+            'from spongecake.fundamentals import InvestorsChronicleInterface\n'
+            'assert isinstance(InvestorsChronicleInterface, type)\n')
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_conditional_get_reuses_unchanged_page(session):
+    def respond(headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse('http://site/page', status_code=304)
+        return FakeResponse('http://site/page', content=TABLE.encode('utf-8'),
+                            headers={'Content-Type': 'text/html; charset=utf-8', 'ETag': '"v1"'})
+    session.responses['http://site/page'] = respond
+
+    first = fwi.download_web_page('http://site/page')
+    second = fwi.download_web_page('http://site/page')
+    assert second == first
+    assert [headers.get('If-None-Match') for _, headers in session.requests] == [None, '"v1"']
+
+
+def test_conditional_get_cache_is_bounded(session, monkeypatch):
+    monkeypatch.setattr(fwi, 'CONDITIONAL_GET_CACHE_MAXSIZE', 2)
+    for page in 'abc':
+        url = 'http://site/' + page
+        session.responses[url] = FakeResponse(url, content=b'<p>x</p>', headers={'ETag': page})
+        fwi.download_web_page(url)
+    fwi.download_web_page('http://site/b')
+    assert list(fwi._CONDITIONAL_GET_CACHE) == ['http://site/c', 'http://site/b']
+
+
+def test_get_dataframes_from_url_failures_are_not_memoised(session):
+    fwi.get_dataframes_from_url.cache_clear()
+    session.responses['http://site/tables'] = FakeResponse('http://site/tables', status_code=503)
+    with pytest.raises(ValueError):
+        fwi.get_dataframes_from_url('http://site/tables')
+
+    # Once the page is back its tables are returned, rather than the remembered failure
+    session.responses['http://site/tables'] = FakeResponse('http://site/tables', content=TABLE.encode('utf-8'),
+                                                           headers={'Content-Type': 'text/html; charset=utf-8'})
+    tables = fwi.get_dataframes_from_url('http://site/tables')
+    assert tables[0].iloc[0, 0] == 'café £5'
+    fwi.get_dataframes_from_url.cache_clear()
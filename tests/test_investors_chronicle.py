@@ -0,0 +1,204 @@
+import gzip
+import importlib
+import pickle
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from spongecake.fundamentals.InvestorsChronicleInterface import IC_INCOME_DATA, InvestorsChronicleInterface
+
+# The package exports the class under the module's name, so get hold of the module itself
+ic_module = importlib.import_module('spongecake.fundamentals.InvestorsChronicleInterface')
+LONDON = ZoneInfo('Europe/London')
+
+INCOME = '''<html><body>
+<table><thead><tr><th>Fiscal data</th><th>2018</th><th>2019</th></tr></thead>
+<tbody>
+<tr><td>Total revenue</td><td>1,000</td><td>1,200</td></tr>
+<tr><td>Net income before taxes</td><td>(50)</td><td>150</td></tr>
+</tbody></table></body></html>'''
+
+BALANCE = '''<html><body>
+<table><thead><tr><th>Fiscal data</th><th>2018</th><th>2019</th></tr></thead>
+<tbody>
+<tr><td>Total current assets</td><td>400</td><td>500</td></tr>
+<tr><td>Total assets</td><td>2,000</td><td>2,500</td></tr>
+<tr><td>Total current liabilities</td><td>200</td><td>250</td></tr>
+<tr><td>Total debt</td><td>300</td><td>(10)</td></tr>
+<tr><td>Total liabilities</td><td>900</td><td>1,000</td></tr>
+</tbody></table></body></html>'''
+
+SUMMARY = '''<html><body>
+<span>Price (GBX)</span><span class="mod-ui-data-list__value">1,234.5</span>
+<table><tr><th>Open</th><td>1,230</td></tr><tr><th>High</th><td>1,240</td></tr></table>
+<table><tr><th>Shares outstanding</th><td>150.50m</td></tr><tr><th>P/E (TTM)</th><td>12.5</td></tr></table>
+<table><tr><th>EPS (TTM)</th><td>0.85 GBP</td></tr><tr><th>Market cap</th><td>1.8bn GBP</td></tr></table>
+</body></html>'''
+
+
+class FakeSite:
+    # Stands in for download_web_page, counting the downloads of each page
+    def __init__(self):
+        self.downloads = Counter()
+
+    def __call__(self, url):
+        if 'IncomeStatement' in url:
+            page = 'income'
+        elif 'BalanceSheet' in url:
+            page = 'balance'
+        else:
+            page = 'summary'
+        self.downloads[page] += 1
+        return {'income': INCOME, 'balance': BALANCE, 'summary': SUMMARY}[page]
+
+
+@pytest.fixture
+def site():
+    return FakeSite()
+
+
+def _interface(site, **kwargs):
+    interface = InvestorsChronicleInterface(**kwargs)
+    interface.download_web_page = site
+    return interface
+
+
+@pytest.mark.parametrize('getter', ['get_eps', 'get_price_to_earnings_ratio', 'get_earnings_yield_pct',
+                                    'get_nav_per_share', 'get_nav_per_share_as_pct_of_price', 'snapshot'])
+def test_ratios_download_each_sheet_once_without_caching(site, getter):
+    interface = _interface(site)
+    interface.disable_all_caching = True
+    value = getattr(interface, getter)('ABC')
+
+    assert site.downloads['income'] <= 1 and site.downloads['balance'] <= 1
+    # The same figures as when the sheets come from the caches
+    assert value == getattr(_interface(FakeSite()), getter)('ABC')
+
+
+def _persisted_records(path):
+    records = []
+    with gzip.open(path, 'rb') as fh:
+        while True:
+            try:
+                records.append(pickle.load(fh))
+            except EOFError:
+                return records
+
+
+def test_caches_persist_between_instances(site, tmp_path):
+    interface = _interface(site, persistent_cache_dir=str(tmp_path))
+    price = interface.get_current_ic_price('ABC')
+    income = interface.get_ic_income_sheet('ABC')
+
+    reloaded_site = FakeSite()
+    reloaded = _interface(reloaded_site, persistent_cache_dir=str(tmp_path))
+    assert reloaded.get_current_ic_price('ABC') == price
+    assert reloaded.get_ic_income_sheet('ABC').equals(income)
+    assert sum(reloaded_site.downloads.values()) == 0
+
+
+def test_persisted_log_is_compacted(site, tmp_path):
+    interface = _interface(site, persistent_cache_dir=str(tmp_path))
+    # Every price goes stale at once, so each call downloads and appends another record for the same key
+    interface.market_hours_price_cache_age = interface.out_of_hours_price_cache_age = 0
+    interface.get_current_ic_price('ABC')
+    interface.raw_html_cache.clear()
+    interface.get_current_ic_price('ABC')
+    path = tmp_path / 'price_cache.pkl.gz'
+    assert len(_persisted_records(path)) == 2
+
+    _interface(FakeSite(), persistent_cache_dir=str(tmp_path))
+    assert [key for key, _ in _persisted_records(path)] == [('ABC', 'LSE')]
+
+
+@pytest.mark.parametrize('now, ttl', [
+    (datetime(2024, 6, 3, 10, 0, tzinfo=LONDON), 30),       # Monday, trading
+    (datetime(2024, 6, 3, 7, 50, tzinfo=LONDON), 600),      # Monday, ten minutes before the open
+    (datetime(2024, 6, 3, 7, 59, 30, tzinfo=LONDON), 30),   # Monday, half a minute before the open
+    (datetime(2024, 6, 3, 17, 0, tzinfo=LONDON), 3600),     # Monday, after the close
+    (datetime(2024, 6, 8, 12, 0, tzinfo=LONDON), 3600),     # Saturday
+    (datetime(2024, 6, 2, 7, 30, tzinfo=LONDON), 3600),     # Sunday, the next open is Monday's
+])
+def test_price_ttl_follows_market_hours(now, ttl):
+    assert InvestorsChronicleInterface().default_ttl_policy('price_cache', now) == ttl
+
+
+def test_deprecated_maximum_price_cache_age_overrides_both_ages(monkeypatch):
+    monkeypatch.setattr(InvestorsChronicleInterface, 'maximum_price_cache_age', 5)
+    interface = InvestorsChronicleInterface()
+    assert interface.default_ttl_policy('price_cache', datetime(2024, 6, 3, 10, 0, tzinfo=LONDON)) == 5
+    assert interface.default_ttl_policy('price_cache', datetime(2024, 6, 8, 12, 0, tzinfo=LONDON)) == 5
+
+
+def test_entries_expire_after_their_ttl(site, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ic_module, 'monotonic', lambda: clock[0])
+    interface = _interface(site)
+    interface.maximum_income_cache_age = 60
+    interface.get_ic_income_sheet('ABC')
+    clock[0] += 59
+    interface.get_ic_income_sheet('ABC')
+    assert site.downloads['income'] == 1
+
+    clock[0] += 1
+    interface.get_ic_income_sheet('ABC')
+    assert site.downloads['income'] == 2
+
+
+def test_concurrent_misses_share_one_download(site):
+    release = threading.Event()
+
+    def slow_site(url):
+        release.wait(5)
+        return site(url)
+
+    interface = _interface(slow_site)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(interface.get_ic_income_sheet('ABC'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Let every thread miss the cache and find the download in progress before it finishes
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert site.downloads['income'] == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_derived_ratios_are_memoised_against_their_source_entries(site):
+    interface = _interface(site)
+    roce = interface.get_roce_pct('ABC')
+
+    # Changing the figures behind the cached entry doesn't change the memoised ratio...
+    inserted_at, ttl, income = interface.income_cache[('ABC', 'LSE')]
+    income.latest[IC_INCOME_DATA.ROW_NET_INCOME_BEFORE_TAXES] = 0.0
+    assert interface.get_roce_pct('ABC') == roce
+
+    # ...but replacing the entry means it is worked out again
+    interface.income_cache[('ABC', 'LSE')] = (inserted_at, ttl, income)
+    assert interface.get_roce_pct('ABC') == 0.0
+    assert sum(site.downloads.values()) == 2
+
+
+def test_least_recently_used_entries_are_evicted(site):
+    interface = _interface(site, max_cache_entries=2)
+    interface.get_roce_pct('AAA')
+    interface.get_ic_income_sheet('BBB')
+    # Using AAA again leaves BBB as the least recently used when CCC is added
+    interface.get_ic_income_sheet('AAA')
+    interface.get_ic_income_sheet('CCC')
+
+    assert list(interface.income_cache) == [('AAA', 'LSE'), ('CCC', 'LSE')]
+    assert site.downloads['income'] == 3
+
+    interface.get_ic_balance_sheet('BBB')
+    interface.get_ic_balance_sheet('CCC')
+    # AAA's ratios go with its balance sheet
+    assert ('AAA', 'LSE') not in interface.balance_cache
+    assert ('AAA', 'LSE') not in interface.derived_cache
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('numba')
+
+from spongecake.prices.PricesInterface import PRICES_COLS
+from spongecake.technicals import _kernels
+from spongecake.technicals.Indicators import INDICATOR_COLS, Indicators
+
+
+# Each numba kernel should give what the pandas path it replaces gives, gaps, flat prices and short histories included
+
+
+def _random_walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 + rng.standard_normal(n).cumsum()
+
+
+def _with_gaps(values):
+    values = values.copy()
+    values[[3, 4, 20, len(values) - 1]] = np.nan
+    return values
+
+
+SERIES = {
+    'random walk': _random_walk(200),
+    'nan gaps': _with_gaps(_random_walk(200)),
+    'leading nans': np.concatenate([np.full(10, np.nan), _random_walk(50)]),
+    'flat': np.full(60, 42.0),
+    'flat then moving': np.concatenate([np.full(30, 42.0), _random_walk(30)]),
+    'all nan': np.full(20, np.nan),
+    'shorter than window': _random_walk(5),
+    'single value': np.array([1.0]),
+}
+
+
+@pytest.mark.parametrize('window', [1, 3, 14, 100])
+@pytest.mark.parametrize('name', SERIES)
+def test_rolling_min_matches_pandas(name, window):
+    values = SERIES[name]
+    expected = pd.Series(values).rolling(window).min().to_numpy()
+    np.testing.assert_array_equal(_kernels.rolling_min(values, window), expected)
+
+
+@pytest.mark.parametrize('window', [1, 3, 14, 100])
+@pytest.mark.parametrize('name', SERIES)
+def test_rolling_max_matches_pandas(name, window):
+    values = SERIES[name]
+    expected = pd.Series(values).rolling(window).max().to_numpy()
+    np.testing.assert_array_equal(_kernels.rolling_max(values, window), expected)
+
+
+@pytest.mark.parametrize('spans', [(3, 26, 9), (12, 26, 9), (1, 1, 1), (50, 300, 20)])
+@pytest.mark.parametrize('name', SERIES)
+def test_macd_matches_pandas(name, spans):
+    short_span, long_span, signal_span = spans
+    closes = pd.Series(SERIES[name])
+    expected_macd = closes.ewm(span=short_span, adjust=False, min_periods=short_span).mean() - \
+                    closes.ewm(span=long_span, adjust=False, min_periods=long_span).mean()
+    expected_signal = expected_macd.ewm(span=signal_span, adjust=False, min_periods=signal_span).mean()
+
+    macd, signal = _kernels.macd(closes.to_numpy(), short_span, long_span, signal_span)
+    np.testing.assert_allclose(macd, expected_macd.to_numpy(), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(signal, expected_signal.to_numpy(), rtol=1e-12, atol=1e-12)
+
+
+def _prices(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.standard_normal(n).cumsum()
+    return pd.DataFrame({PRICES_COLS.COL_CLOSE: close,
+                         PRICES_COLS.COL_HIGH: close + rng.random(n),
+                         PRICES_COLS.COL_LOW: close - rng.random(n)})
+
+
+@pytest.mark.parametrize('window', [1, 14, 500])
+def test_stochastic_oscillator_matches_pandas_path(monkeypatch, window):
+    df_prices = _prices(300, 0)
+    df_prices.iloc[[10, 11, 150], :] = np.nan
+    # A flat stretch, where high == low gives 0/0
+    df_prices.iloc[200:230, :] = 50.0
+    with_numba = Indicators.set_stochastic_oscillator(df_prices.copy(), window)
+
+    monkeypatch.setattr(_kernels, 'HAVE_NUMBA', False)
+    without_numba = Indicators.set_stochastic_oscillator(df_prices.copy(), window)
+    for col in (INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN, INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_D_COLUMN):
+        np.testing.assert_allclose(with_numba[col].to_numpy(), without_numba[col].to_numpy(), rtol=1e-12, atol=1e-12)
+
+
+def _pandas_stochastic_k(df_prices, window):
+    low_roll_min = df_prices[PRICES_COLS.COL_LOW].rolling(window).min()
+    high_roll_max = df_prices[PRICES_COLS.COL_HIGH].rolling(window).max()
+    return (((df_prices[PRICES_COLS.COL_CLOSE] - low_roll_min) / (high_roll_max - low_roll_min)) * 100).to_numpy()
+
+
+@pytest.mark.parametrize('window', [1, 14, 500])
+def test_stochastic_k_batch_matches_pandas(window):
+    frames = [_prices(n, seed) for seed, n in enumerate([300, 40, 14, 3, 1])]
+    frames[0].iloc[[10, 11, 150], :] = np.nan
+    # A flat stretch, where high == low gives 0/0
+    frames[1].iloc[:20, :] = 50.0
+
+    n_rows = max(len(df_prices) for df_prices in frames)
+    stacked = {}
+    for col in (PRICES_COLS.COL_CLOSE, PRICES_COLS.COL_HIGH, PRICES_COLS.COL_LOW):
+        stacked[col] = np.full((n_rows, len(frames)), np.nan, order='F')
+        for j, df_prices in enumerate(frames):
+            stacked[col][n_rows - len(df_prices):, j] = df_prices[col].to_numpy()
+
+    stochastic_k = _kernels.stochastic_k_batch(stacked[PRICES_COLS.COL_CLOSE], stacked[PRICES_COLS.COL_HIGH],
+                                               stacked[PRICES_COLS.COL_LOW], window)
+    for j, df_prices in enumerate(frames):
+        np.testing.assert_allclose(stochastic_k[n_rows - len(df_prices):, j], _pandas_stochastic_k(df_prices, window),
+                                   rtol=1e-12, atol=1e-12)
+
+
+def test_stochastic_oscillator_batch_matches_each_frame():
+    prices = {'tidm{0}'.format(n): _prices(n, n) for n in [250, 60, 14, 2]}
+    prices['tidm60'].iloc[[5, 30], :] = np.nan
+    expected = {tidm: Indicators.set_stochastic_oscillator(df_prices.copy()) for tidm, df_prices in prices.items()}
+
+    Indicators.set_stochastic_oscillator_batch(prices)
+    for tidm, df_prices in prices.items():
+        for col in (INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_K_COLUMN, INDICATOR_COLS.COL_STOCHASTIC_OSCILLATOR_D_COLUMN):
+            np.testing.assert_allclose(df_prices[col].to_numpy(), expected[tidm][col].to_numpy(), rtol=1e-12, atol=1e-12)
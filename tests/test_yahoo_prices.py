@@ -0,0 +1,141 @@
+import importlib
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+import yfinance as yf
+
+from spongecake.prices.PricesInterface import PRICES_COLS
+from spongecake.prices.YahooPricesInterface import YahooPricesInterface
+
+# The package re-exports the class under the module's name, so get hold of the module itself
+yahoo_module = importlib.import_module('spongecake.prices.YahooPricesInterface')
+
+YAHOO_FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+class FakeDownload:
+    # Stands in for yf.download: business days in [start, end), grouped by ticker. Tickers in no_prices come back empty,
+    # as yfinance leaves them for a delisted tidm or a range with no trading days. Each entry in raises is raised in turn.
+    def __init__(self, no_prices=(), raises=()):
+        self.no_prices = set(no_prices)
+        self.raises = list(raises)
+        self.calls = []
+
+    def __call__(self, tickers, start, end, **kwargs):
+        self.calls.append((tickers, start, end))
+        if self.raises:
+            raise self.raises.pop(0)
+        index = pd.bdate_range(start, end, inclusive='left', name='Date')
+        columns = pd.MultiIndex.from_product([tickers.split(), YAHOO_FIELDS])
+        df = pd.DataFrame(np.arange(len(index) * len(columns), dtype=float).reshape(len(index), len(columns)),
+                          index=index, columns=columns)
+        for ticker in tickers.split():
+            if ticker in self.no_prices:
+                df[ticker] = np.nan
+        return df
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(yahoo_module.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def _stub_download(monkeypatch, **kwargs):
+    download = FakeDownload(**kwargs)
+    monkeypatch.setattr(yf, 'download', download)
+    return download
+
+
+def test_range_without_prices_is_not_retried(monkeypatch, sleeps):
+    download = _stub_download(monkeypatch)
+    prices = YahooPricesInterface().get_yahoo_prices('VOD', from_date=date(2024, 6, 1), to_date=date(2024, 6, 2))
+    assert prices.empty
+    assert len(download.calls) == 1
+    assert sleeps == []
+
+
+def test_tidm_without_prices_is_not_retried(monkeypatch, sleeps):
+    download = _stub_download(monkeypatch, no_prices={'DEAD.L'})
+    prices = YahooPricesInterface().get_yahoo_prices_many(['VOD', 'DEAD'], from_date=date(2024, 1, 1), to_date=date(2024, 1, 5))
+    assert list(prices) == ['VOD']
+    assert len(download.calls) == 1
+    assert sleeps == []
+
+
+def test_raised_download_is_retried(monkeypatch, sleeps):
+    download = _stub_download(monkeypatch, raises=[yf.exceptions.YFRateLimitError(), OSError('connection reset')])
+    prices = YahooPricesInterface().get_yahoo_prices('vod', from_date=date(2024, 1, 1), to_date=date(2024, 1, 5))
+    assert len(prices) == 5
+    assert list(prices.columns[:4]) == [PRICES_COLS.COL_OPEN, PRICES_COLS.COL_HIGH, PRICES_COLS.COL_LOW, PRICES_COLS.COL_CLOSE]
+    # Looked up upper cased, as yfinance labels its columns
+    assert [call[0] for call in download.calls] == ['VOD.L'] * 3
+    assert len(sleeps) == 2 and sleeps[0] < sleeps[1]
+
+
+def test_retries_give_up(monkeypatch, sleeps):
+    download = _stub_download(monkeypatch, raises=[OSError('down')] * 10)
+    interface = YahooPricesInterface()
+    assert interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 5)).empty
+    assert len(download.calls) == interface.max_download_retries
+    assert len(sleeps) == interface.max_download_retries - 1
+
+
+def test_persisted_prices_round_trip(monkeypatch, tmp_path):
+    pytest.importorskip('pyarrow')
+    download = _stub_download(monkeypatch)
+    YahooPricesInterface(persistent_cache_dir=str(tmp_path)).get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 31))
+
+    # A new instance reads a narrower range back from disk rather than downloading it
+    prices = YahooPricesInterface(persistent_cache_dir=str(tmp_path)).get_yahoo_prices('VOD', from_date=date(2024, 1, 8), to_date=date(2024, 1, 12))
+    assert len(download.calls) == 1
+    assert list(prices.index) == list(pd.bdate_range('2024-01-08', '2024-01-12'))
+    assert prices[PRICES_COLS.COL_CLOSE].dtype == np.float64
+
+
+def test_todays_prices_are_not_kept_as_final(monkeypatch, tmp_path):
+    pytest.importorskip('pyarrow')
+    download = _stub_download(monkeypatch)
+    today = date.today()
+    interface = YahooPricesInterface(persistent_cache_dir=str(tmp_path))
+    interface.get_yahoo_prices('VOD', from_date=today - timedelta(days=30), to_date=today)
+
+    df_persisted = pd.read_parquet(tmp_path / 'VOD.L.parquet')
+    assert df_persisted.attrs['to_date'] == (today - timedelta(days=1)).isoformat()
+    assert df_persisted.index.max() < pd.Timestamp(today)
+
+    # Neither the range index nor the file covers today, so a window ending today is downloaded again
+    interface.get_yahoo_prices('VOD', from_date=today - timedelta(days=20), to_date=today)
+    YahooPricesInterface(persistent_cache_dir=str(tmp_path)).get_yahoo_prices('VOD', from_date=today - timedelta(days=30), to_date=today)
+    assert len(download.calls) == 3
+
+
+def test_cache_hit_skips_download(monkeypatch):
+    download = _stub_download(monkeypatch)
+    interface = YahooPricesInterface()
+    first = interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 5))
+    assert interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 5)) is first
+    assert len(download.calls) == 1
+
+    interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 5), force_cache_refresh=True)
+    assert len(download.calls) == 2
+
+
+def test_ranges_are_merged_and_narrower_ranges_sliced(monkeypatch):
+    download = _stub_download(monkeypatch)
+    interface = YahooPricesInterface()
+    interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 1), to_date=date(2024, 1, 12))
+    # Touches the first range, so the two are merged into one
+    interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 13), to_date=date(2024, 1, 31))
+    assert [(from_date, to_date) for from_date, to_date, _ in interface._range_index[('VOD', 'L')]] == [(date(2024, 1, 1), date(2024, 1, 31))]
+
+    prices = interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 10), to_date=date(2024, 1, 16))
+    assert len(download.calls) == 2
+    assert list(prices.index) == list(pd.bdate_range('2024-01-10', '2024-01-16'))
+
+    # Columns a caller adds don't find their way back into the range index
+    prices['STO_K'] = 1.0
+    assert 'STO_K' not in interface.get_yahoo_prices('VOD', from_date=date(2024, 1, 10), to_date=date(2024, 1, 11)).columns